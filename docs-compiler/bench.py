@@ -0,0 +1,1225 @@
+import hashlib
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess as sp
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+import click
+
+from . import cli, fetch
+from .cache import compiler_version
+from .fixture import (
+    compile_fixture,
+    fixture_work,
+    make_fixture,
+    make_work,
+    values_table,
+    working_in,
+)
+from .links import scan_links
+from .log import captured, print
+from .nav import mkdocs_config, site_config
+from .pipeline import Document
+from .prenpost import preflight
+from .repo import BigBangRepo
+from .utils import add_frontmatter, get_release_notes, tree_index
+from .values import dumps_values_json, parse_values, render_values_md
+
+# only needed once a command does real work, importing the CLI modules must not load them
+heavy_modules = [
+    "deepmerge",
+    "frontmatter",
+    "git",
+    "jinja2",
+    "requests",
+    "rich",
+    "ruamel.yaml",
+    "semver",
+    "yaml",
+]
+
+startup_probe = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in sys.argv[2:] if m in sys.modules]]))
+"""
+
+# slowdowns smaller than this are noise, whatever the tolerance
+noise_floor = 0.05
+
+# how `patch_external_refs` found links before `links.scan_links`, for `bb-docs-bench scan` to compare against
+legacy_link_regex = re.compile(r"\]\(([^\)]*)\)")
+legacy_fence_regex = re.compile(
+    r"^```[^\S\r\n]*[a-z]*(?:\n(?!```$).*)*\n```", re.MULTILINE
+)
+
+# markdown that gets harder to scan as it grows, line -> n lines of it
+scan_inputs = {
+    "changelog": lambda n: "".join(
+        f"- fix [MR {i}](https://repo1.dso.mil/mr/{i}) see [docs](docs/page{i}.md#top)\n"
+        + ("```yaml\n[fenced](a.md)\n```\n" if i % 50 == 0 else "")
+        for i in range(n)
+    ),
+    "unclosed fences": lambda n: "```yaml\n[link](a.md)\n" * (n // 2),
+    "link soup": lambda n: "](" * (n * 20) + "\n",
+    "nested parens": lambda n: "[x](" + "(" * (n * 20) + "\n",
+    "code spans": lambda n: "`` ` [x](a.md) " * (n * 5) + "\n",
+}
+
+
+def timed(fn, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name, times, detail=""):
+    print(
+        f"INFO     - {name}: best {min(times) * 1000:.1f}ms, median {statistics.median(times) * 1000:.1f}ms over {len(times)} rounds{detail}"
+    )
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+def bench():
+    pass
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+def links(rounds):
+    """
+    Time link patching over Big Bang's docs, as checked out in `submodules/bigbang`
+    """
+    from ruamel.yaml import YAML
+
+    bb = BigBangRepo()
+    with Path().cwd().joinpath("docs-compiler.yaml").open("r") as f:
+        include = YAML().load(f)["/"]["include"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        with captured():
+            markdown = bb.copy_files(bb.path, root, include)
+        pages = [(dst, Path(src).read_text()) for src, dst in markdown]
+        n_links = sum(len(list(scan_links(text))) for _, text in pages)
+        n_bytes = sum(len(text) for _, text in pages)
+
+        report("Indexing output tree", timed(lambda: tree_index(root), rounds))
+        report("Indexing repo (cold)", timed(bb.tracked_paths, 1))
+        index = tree_index(root) | {os.path.normpath(dst) for dst, _ in pages}
+
+        def patch():
+            docs = [Document(dst, text) for dst, text in pages]
+            with captured():
+                for doc in docs:
+                    bb.patch_external_refs(doc, root, index)
+
+        report(
+            "Link patching",
+            timed(patch, rounds),
+            f" ({len(pages)} files, {n_links} links, {n_bytes} bytes)",
+        )
+
+
+def peak_memory(fn):
+    """
+    Bytes allocated at most while fn runs
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=3)
+@click.option(
+    "-s",
+    "--sizes",
+    help="Comma separated input sizes in lines, default (1000,4000)",
+    default="1000,4000",
+)
+@click.option(
+    "--legacy/--no-legacy",
+    help="Time the regexes the scanner replaced too, they take minutes on some of these inputs",
+    default=False,
+)
+def scan(rounds, sizes, legacy):
+    """
+    Time finding the links of pathological markdown, and check the scanner grows linearly with its input
+    """
+    sizes = [int(s) for s in sizes.split(",")]
+    failed = False
+    for name, make in scan_inputs.items():
+        times = {}
+        for size in sizes:
+            text = make(size)
+            n_links = len(list(scan_links(text)))
+            times[size] = timed(lambda: list(scan_links(text)), rounds)
+            # links are consumed as they're found, like patching does
+            peak = peak_memory(lambda: deque(scan_links(text), maxlen=0))
+            report(
+                f"{name} x {size}",
+                times[size],
+                f" ({len(text)} bytes, {n_links} links, peak {peak / 1024:.0f}KiB)",
+            )
+            if legacy:
+                report(
+                    f"{name} x {size} (regex)",
+                    timed(
+                        lambda: legacy_link_regex.findall(
+                            legacy_fence_regex.sub("", text)
+                        ),
+                        1,
+                    ),
+                )
+        # twice the input may take a bit over twice the time, not four times
+        for small, large in zip(sizes, sizes[1:]):
+            growth = min(times[large]) / max(min(times[small]), 1e-6)
+            if growth > 2 * large / small and min(times[large]) > noise_floor:
+                print(
+                    f"[red]ERROR[/red]    - Scanning '{name}' got {growth:.1f}x slower for {large / small:.1f}x the input"
+                )
+                failed = True
+    if failed:
+        exit(1)
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+@click.option(
+    "-k", "--keys", help="Number of keys in the generated table", default=5000
+)
+def values(rounds, keys):
+    """
+    Time parsing and rendering a generated helm-docs values table
+    """
+    table = values_table(keys)
+    parsed = parse_values(table)
+
+    detail = f" ({len(parsed)} keys)"
+    report("Parsing", timed(lambda: parse_values(table), rounds), detail)
+    report(
+        "Rendering values.md",
+        timed(lambda: render_values_md(parsed, "Bench"), rounds),
+        detail,
+    )
+    report(
+        "Dumping values.json", timed(lambda: dumps_values_json(parsed), rounds), detail
+    )
+
+
+def frontmatter_pages(pages):
+    """
+    Generated pages, every other one starts with a header (title and tags) to merge into
+    """
+    out = []
+    for p in range(pages):
+        header = ""
+        if p % 2:
+            header = f"---\ntitle: Page {p}\ntags:\n- docs\n- page{p % 3}\n---\n\n"
+        out.append(
+            (f"docs/page{p}.md", f"{header}# Page {p}\n\n" + "Lorem ipsum.\n" * 40)
+        )
+    return out
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+@click.option("-p", "--pages", help="Number of generated pages", default=2000)
+def frontmatter(rounds, pages):
+    """
+    Time adding tags to the frontmatter of generated pages, with the built in codec and with python-frontmatter
+    """
+    import frontmatter as python_frontmatter
+    from deepmerge import always_merger
+
+    docs = frontmatter_pages(pages)
+    tags = {"tags": ["docs", "bench"]}
+
+    def codec():
+        out = []
+        for path, text in docs:
+            doc = Document(path, text)
+            add_frontmatter(doc, tags)
+            out.append(doc.dumps())
+        return out
+
+    def reference():
+        # what `Document` / `add_frontmatter` did before the codec
+        out = []
+        for path, text in docs:
+            if python_frontmatter.checks(text):
+                post = python_frontmatter.loads(text)
+            else:
+                post = python_frontmatter.Post(text)
+            had_metadata = post.metadata != {}
+            always_merger.merge(post.metadata, tags)
+            if had_metadata:
+                post.metadata["tags"] = list(dict.fromkeys(post.metadata["tags"]))
+            post.content = post.content.strip()
+            out.append(python_frontmatter.dumps(post))
+        return out
+
+    def unchanged():
+        return [Document(path, text).dumps() for path, text in docs]
+
+    if codec() != reference():
+        print(
+            "[red]ERROR[/red]    - The codec's output differs from python-frontmatter's"
+        )
+        exit(1)
+    detail = f" ({pages} pages)"
+    report("python-frontmatter", timed(reference, rounds), detail)
+    report("Codec", timed(codec, rounds), detail)
+    report("Codec, metadata unchanged", timed(unchanged, rounds), detail)
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+@click.option(
+    "-b",
+    "--budget",
+    help="Fail if the best import time of a CLI module is over this many seconds, default (0.25)",
+    default=0.25,
+    type=click.FLOAT,
+)
+def startup(rounds, budget):
+    """
+    Time importing each CLI module in a fresh interpreter, and check none of them load heavy dependencies
+    """
+    root = Path(__file__).resolve().parent
+    failed = False
+    for module in ["cli", "info", "bench", "cache", "manifest"]:
+        name = f"{root.name}.{module}"
+        times = []
+        for _ in range(rounds):
+            out = sp.run(
+                [sys.executable, "-c", startup_probe, name, *heavy_modules],
+                capture_output=True,
+                check=True,
+                cwd=root.parent,
+                text=True,
+            ).stdout
+            elapsed, loaded = json.loads(out)
+            times.append(elapsed)
+        report(f"Importing {name}", times)
+        if len(loaded) > 0:
+            print(
+                f"[red]ERROR[/red]    - {name} imports {', '.join(loaded)} at module load"
+            )
+            failed = True
+        if min(times) > budget:
+            print(
+                f"[red]ERROR[/red]    - {name} took {min(times):.3f}s to import, over the {budget}s budget"
+            )
+            failed = True
+    if failed:
+        exit(1)
+
+
+@bench.command("compile")
+@click.option(
+    "-s",
+    "--sizes",
+    help="Comma separated fixtures to build, as <packages>x<pages>, default (4x10,16x40)",
+    default="4x10,16x40",
+)
+@click.option(
+    "--history",
+    help="Number of commits in each fixture repo, default (100)",
+    default=100,
+)
+@click.option("-r", "--rounds", help="Number of timed rounds", default=3)
+@click.option(
+    "-j",
+    "--jobs",
+    help="Number of packages to compile in parallel, default (1)",
+    default=1,
+    type=click.IntRange(min=1),
+)
+@click.option("--mkdocs", "render", help="Time `mkdocs build` too", is_flag=True)
+@click.option(
+    "-o",
+    "--output",
+    help="Write the results as JSON to <output>",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--baseline",
+    help="Compare with the JSON of an earlier run, fail on regressions",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "--tolerance",
+    help="Slowdown against the baseline that still passes, default (0.25)",
+    default=0.25,
+)
+def compile_(sizes, history, rounds, jobs, render, output, baseline, tolerance):
+    """
+    Time each stage of a cold build of synthetic Big Bang fixtures, from local repos only
+    """
+    results = {}
+    for size in sizes.split(","):
+        packages, pages = (int(n) for n in size.strip().split("x"))
+        with tempfile.TemporaryDirectory() as tmp:
+            env = make_fixture(tmp, packages, pages, history)
+            runs = [
+                compile_fixture(make_work(Path(tmp) / f"work-{r}"), env, jobs, render)
+                for r in range(rounds)
+            ]
+        # best of the rounds, per stage
+        stages = {name: min(run.get(name, 0.0) for run in runs) for name in runs[0]}
+        total = stages.pop("total")
+        results[size] = {"total": total, "stages": stages}
+        print(f"INFO     - {size} ({packages} packages, {pages} pages): {total:.2f}s")
+        for name, seconds in sorted(stages.items(), key=lambda s: -s[1]):
+            print(f"INFO     -     {name}: {seconds:.3f}s")
+
+    data = {
+        "compiler": compiler_version(),
+        "python": platform.python_version(),
+        "history": history,
+        "jobs": jobs,
+        "mkdocs": render,
+        "rounds": rounds,
+        "results": results,
+    }
+    if output:
+        Path(output).write_text(json.dumps(data, indent=2))
+        print(f"INFO     - Results written to {output}")
+
+    if baseline:
+        regressed = False
+        before = json.loads(Path(baseline).read_text())
+        # totals only compare if both runs timed the same stages
+        same_stages = before.get("mkdocs", False) == render
+        before = before["results"]
+        for size, result in results.items():
+            if size not in before:
+                continue
+            now = {"total": result["total"], **result["stages"]}
+            then = {"total": before[size]["total"], **before[size]["stages"]}
+            for name, seconds in now.items():
+                if name not in then or (name == "total" and not same_stages):
+                    continue
+                if (
+                    seconds > then[name] * (1 + tolerance)
+                    and seconds - then[name] > noise_floor
+                ):
+                    print(
+                        f"[red]ERROR[/red]    - {size} {name} regressed: {then[name]:.3f}s -> {seconds:.3f}s"
+                    )
+                    regressed = True
+        if regressed:
+            exit(1)
+        print(f"INFO     - No regressions against {baseline}")
+
+
+def docs_tree(root, packages, pages):
+    """
+    A compiled docs tree without the compiling: Big Bang's pages and `packages` packages of `pages` docs each
+    """
+    files = ["README.md", "CHANGELOG.md", "CONTRIBUTING.md", "about.md", "values.md"]
+    files += [
+        "docs/guide.md",
+        "docs/understanding-bigbang/configuration/base-config.md",
+    ]
+    files += ["packages/index.md"]
+    for i in range(packages):
+        pkg = f"packages/pkg-{i}"
+        # every page a package's nav lists, awesome-pages points the ones a package lacks at Big Bang's
+        files += [
+            f"{pkg}/{f}"
+            for f in ["README.md", "values.md", "CONTRIBUTING.md", "CHANGELOG.md"]
+        ]
+        files += [
+            f"{pkg}/docs/{'nested/' if p % 4 == 0 else ''}page{p}.md"
+            for p in range(pages)
+        ]
+    for f in files:
+        path = Path(root, f)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"# {path.stem}\n")
+    return {f"pkg-{i}": {} for i in range(packages)}
+
+
+def nav_outline(items):
+    """
+    (title, page / url / children) of the items of an mkdocs nav, to compare navs built different ways
+    """
+    outline = []
+    for item in items:
+        if item.is_section:
+            outline.append((item.title, nav_outline(item.children)))
+        elif item.is_page:
+            outline.append((item.title, item.file.src_path))
+        else:
+            outline.append((item.title, item.url))
+    return outline
+
+
+@bench.command()
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+@click.option("-p", "--packages", help="Number of generated packages", default=40)
+@click.option("--pages", help="Number of docs in each package", default=40)
+def nav(rounds, packages, pages):
+    """
+    Time resolving the nav of a generated docs tree, and mkdocs loading it against awesome-pages walking `.pages` files
+    """
+    import warnings
+
+    import yaml
+    from mkdocs.config import load_config as load_mkdocs_config
+    from mkdocs.structure.files import get_files
+    from mkdocs.structure.nav import get_navigation
+
+    from .nav import write_nav
+
+    meta = json.loads(json.dumps(cli.load_config()))
+
+    def mkdocs_nav(config_file):
+        # the events of `mkdocs build` up to the nav, awesome-pages finds the `.pages` files in `on_files`
+        with warnings.catch_warnings():
+            # awesome-pages warns about every nav entry a package doesn't have
+            warnings.simplefilter("ignore")
+            config = load_mkdocs_config(str(config_file))
+            plugins = config["plugins"]
+            config = plugins.run_event("config", config)
+            files = plugins.run_event("files", get_files(config), config=config)
+            nav = get_navigation(files, config)
+            return plugins.run_event("nav", nav, config=config, files=files)
+
+    generated = Path.cwd() / ".mkdocs-bench-nav.yml"
+    legacy = Path.cwd() / ".mkdocs-bench-pages.yml"
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_root = Path(tmp) / "docs"
+        configs = cli.package_configs(meta, docs_tree(docs_root, packages, pages))
+        n_pages = sum(1 for p in tree_index(docs_root) if p.endswith(".md"))
+        bb = cli.bb_nav(meta, docs_root)
+        report(
+            f"Resolving the nav of {packages} packages, {n_pages} pages",
+            timed(lambda: write_nav(docs_root, bb, configs), rounds),
+        )
+
+        # what the compiler wrote before, a `.pages` per folder that awesome-pages finds while mkdocs builds
+        for folder, pages_config in [
+            ("", meta["/"]["pages"]),
+            (
+                "packages",
+                {"nav": [{"Home": "index.md"}] + [{p: p} for p in sorted(configs)]},
+            ),
+            *[(f"packages/{p}", c["pages"]) for p, c in configs.items()],
+        ]:
+            (docs_root / folder / ".pages").write_text(yaml.safe_dump(pages_config))
+        try:
+            mkdocs_config(docs_root, generated)
+            generated.write_text(generated.read_text() + "plugins: []\n")
+            legacy.write_text(
+                f"INHERIT: mkdocs.yml\ndocs_dir: {docs_root}\n"
+                "plugins:\n- awesome-pages:\n    collapse_single_pages: false\n    strict: false\n"
+            )
+            report(
+                "mkdocs with the generated nav",
+                timed(lambda: mkdocs_nav(generated), rounds),
+            )
+            try:
+                report(
+                    "mkdocs with awesome-pages",
+                    timed(lambda: mkdocs_nav(legacy), rounds),
+                )
+            except Exception as e:
+                print(f"[yellow]WARNING  -[/yellow] Skipped awesome-pages: {e}")
+                return
+            if nav_outline(mkdocs_nav(generated).items) != nav_outline(
+                mkdocs_nav(legacy).items
+            ):
+                print(
+                    "[red]ERROR[/red]    - The generated nav differs from awesome-pages'"
+                )
+                exit(1)
+            print("INFO     - The generated nav is the one awesome-pages builds")
+        finally:
+            generated.unlink(missing_ok=True)
+            legacy.unlink(missing_ok=True)
+
+
+@bench.command("link-graph")
+@click.option("-r", "--rounds", help="Number of timed rounds", default=5)
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to link, as <packages>x<pages>, default (16x40)",
+    default="16x40",
+)
+def link_graph(rounds, size):
+    """
+    Time resolving every link of a compiled fixture against the site's index, and check what it leaves alone
+
+    Fails if a link to a page of the site still goes upstream, or if a link reported broken has a target in its repo
+    """
+    from .linkgraph import site_index, upstream_target
+
+    with fixture_work(size):
+        with captured():
+            bb = BigBangRepo()
+            bb.checkout("1.42.0")
+        pkgs = bb.get_pkgs()
+        meta = cli.load_config()
+        broken = []
+
+        def link():
+            broken[:] = cli.link_site(bb, pkgs, meta, Path("docs"))
+
+        # every link is resolved already, this is what a build pays for it without the writes
+        times = timed(link, rounds)
+        texts = {p: p.read_text() for p in Path("docs").rglob("*.md")}
+        n_links = sum(len(list(scan_links(t))) for t in texts.values())
+        report("Resolving links", times, f" ({len(texts)} pages, {n_links} links)")
+
+        upstreams = {bb.name: bb.upstream}
+        upstreams.update({pkg: pkgs[pkg]["repo"] for pkg in pkgs})
+        index = site_index(Path("docs"), upstreams, meta["/"]["include"])
+        sources = {bb.name: Path(meta["/"]["source"])}
+        sources.update({pkg: Path("submodules") / pkg for pkg in pkgs})
+        external = []
+        for path, text in texts.items():
+            for _, _, target in scan_links(text):
+                upstream = upstream_target(target) if "://" in target else None
+                if upstream is None or upstream[0] not in index.repos:
+                    continue
+                if index.site_path(index.repos[upstream[0]], upstream[1]):
+                    external.append(f"'{path}': '{target}'")
+        found = []
+        for page, target in broken:
+            if page not in index.origins:
+                # `base` pages have no repo
+                continue
+            repo, source = index.origins[page]
+            rel = os.path.join(os.path.dirname(source), target.split("#")[0])
+            if (sources[repo] / rel).exists():
+                found.append(f"'{page}': '{target}'")
+    print(f"INFO     - {len(broken)} broken link(s), {len(external)} left upstream")
+    if len(external) > 0:
+        print(
+            f"[red]ERROR[/red]    - {len(external)} link(s) go upstream for a page of the site: {', '.join(external[:5])}"
+        )
+        exit(1)
+    if len(found) > 0:
+        print(
+            f"[red]ERROR[/red]    - {len(found)} link(s) reported broken have a target: {', '.join(found[:5])}"
+        )
+        exit(1)
+
+
+def git_children():
+    """
+    git processes this process started that are still running, None where /proc can't tell
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    pid, n = str(os.getpid()), 0
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().split()
+            except OSError:
+                continue
+            n += fields[1] == "(git)" and fields[3] == pid
+    return n
+
+
+@bench.command()
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to build, as <packages>x<pages>, default (40x10)",
+    default="40x10",
+)
+@click.option("--handles", help="Repo handles open at most, default (4)", default=4)
+@click.option("--processes", help="git processes at once, default (2)", default=2)
+def git(size, handles, processes):
+    """
+    Compile a fixture on 8 workers with few repo handles and git processes, and fail if more are ever open
+    """
+    from . import repo
+
+    repo.repo_pool.close()
+    repo.repo_pool.size = handles
+    repo.repo_pool.peak = repo.repo_pool.evicted = 0
+    repo.git_stats.slots = threading.BoundedSemaphore(processes)
+    repo.git_stats.reset()
+
+    alive, done = [0], threading.Event()
+
+    def sample():
+        while not done.wait(0.002):
+            alive[0] = max(alive[0], git_children() or 0)
+
+    with fixture_work(size, compiled=False) as (work, env):
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            stages = compile_fixture(work, env, 8, False)
+        finally:
+            done.set()
+            sampler.join()
+            repo.repo_pool.close()
+    report("Cold build", [stages["total"]])
+    print(repo.git_summary())
+
+    errors = []
+    if repo.repo_pool.peak > handles:
+        errors.append(f"{repo.repo_pool.peak} repo handles were open")
+    if repo.git_stats.peak > processes:
+        errors.append(f"{repo.git_stats.peak} git processes ran at once")
+    if git_children() is not None and alive[0] > processes + repo.git_stats.helpers:
+        errors.append(f"{alive[0]} git processes were alive at once")
+    if len(errors) > 0:
+        print(f"[red]ERROR[/red]    - {', '.join(errors)}, over the limits")
+        exit(1)
+    print(
+        f"INFO     - At most {alive[0]} git process(es) alive at once, within {processes} and {handles} handle(s)"
+    )
+
+
+@bench.command()
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to build, as <packages>x<pages>, default (16x40)",
+    default="16x40",
+)
+def precompress(size):
+    """
+    Time `--precompress` on a fixture's site cold, warm and after the search index changed, and check its output against custom-csp.conf
+    """
+    import gzip
+    import shutil
+
+    from .publish import fingerprinted_regex, nonce_placeholder
+    from .publish import precompress as precompress_site
+
+    conf = Path(__file__).resolve().parent.parent / "custom-csp.conf"
+    location = re.search(r'location ~ "(.+)"', conf.read_text())
+    if location is None:
+        raise click.ClickException(f"No location for fingerprinted files in {conf}")
+    location = re.compile(location.group(1))
+
+    with fixture_work(size, render=True) as (work, _):
+        built = work / "built"
+        shutil.copytree(work / "site", built)
+        for name in ["cold", "warm", "search index changed"]:
+            if name != "cold":
+                shutil.rmtree("site")
+                shutil.copytree(built, "site")
+            if name == "search index changed":
+                index = Path("site/search/search_index.json")
+                index.write_text(index.read_text() + "\n")
+            with captured() as buf:
+                start = time.perf_counter()
+                precompress_site("site")
+                elapsed = time.perf_counter() - start
+            cached = re.search(r"(\d+)\s+file\(s\),\s+(\d+)\s+from", buf.getvalue())
+            report(name, [elapsed], f", {cached[2]} of {cached[1]} file(s) from cache")
+
+        errors = []
+        site = work / "site"
+        for folder, _, files in os.walk(site):
+            for name in files:
+                path = Path(folder) / name
+                url = "/sites/bb-docs/" + path.relative_to(site).as_posix()
+                if name.endswith(".gz"):
+                    if (
+                        gzip.decompress(path.read_bytes())
+                        != path.with_suffix("").read_bytes()
+                    ):
+                        errors.append(f"'{url}' isn't its sibling compressed")
+                    if nonce_placeholder in path.with_suffix("").read_bytes():
+                        errors.append(f"'{url}' would skip Padawan's nonce")
+                elif path.relative_to(site).parts[0] == "static":
+                    fingerprinted = fingerprinted_regex.search(name) is not None
+                    if fingerprinted != (location.search(url) is not None):
+                        errors.append(f"'{url}' is cached differently than it is named")
+                if path.suffix == ".html":
+                    for target in re.findall(
+                        r'(?:href|src)="([^"#?]*static/[^"#?]*)"', path.read_text()
+                    ):
+                        # 404.html is served for any path, its urls start at the site's root
+                        base = site if target.startswith("/") else Path(folder)
+                        if (
+                            "://" not in target
+                            and not (base / target.lstrip("/")).exists()
+                        ):
+                            errors.append(f"'{url}' points at missing '{target}'")
+    if len(errors) > 0:
+        print(
+            f"[red]ERROR[/red]    - {len(errors)} problem(s): {', '.join(errors[:5])}"
+        )
+        exit(1)
+    print(
+        "INFO     - Every `.gz` matches its file and none holds a nonce placeholder, fingerprinted assets are the ones custom-csp.conf caches"
+    )
+
+
+@bench.command("watch")
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to watch, as <packages>x<pages>, default (8x20)",
+    default="8x20",
+)
+@click.option(
+    "--budget",
+    help="Fail if an edit takes longer than this many seconds to rebuild, default (1.0)",
+    default=1.0,
+)
+def watch(size, budget):
+    """
+    Time how long `--dev` takes to rebuild after a page, a README and a package tag change in a fixture
+    """
+    from .watch import Watch
+
+    with fixture_work(size, compiled=False) as (work, _):
+        # a newer release of pkg-0 for Big Bang to bump to
+        pkg = work.parent / "repo1" / "platform-one" / "big-bang" / "apps" / "pkg-0.git"
+        sp.run(["git", "tag", "1.0.1-bb.0", "main~1"], cwd=pkg, check=True)
+        with captured():
+            bb = BigBangRepo()
+            bb.checkout("1.42.0")
+            preflight(bb)
+            repos = {}
+            cli.compile(bb, "1.42.0", repos=repos)
+            watcher = Watch(bb, "1.42.0", repos=repos)
+
+        def append(path):
+            def edit():
+                with open(path, "a") as f:
+                    f.write("\nEdited while watching\n")
+
+            return edit
+
+        def describe():
+            readme = Path("submodules/pkg-1/README.md")
+            readme.write_text(
+                readme.read_text().replace(
+                    "| Toggle 0 |", "| Toggle 0 while watching |"
+                )
+            )
+
+        def bump():
+            values = Path("submodules/bigbang/chart/values.yaml")
+            values.write_text(values.read_text().replace("1.0.0-bb.0", "1.0.1-bb.0", 1))
+
+        # the docs are staged from it, an edit must never reach the cached packages
+        cached = {
+            path: hashlib.sha256(path.read_bytes()).digest()
+            for path in Path(".cache/build").rglob("*")
+            if path.is_file()
+        }
+        edits = {
+            "page": (
+                append("submodules/pkg-0/docs/page1.md"),
+                "docs/packages/pkg-0/docs/page1.md",
+            ),
+            # changes its values.json too
+            "README": (describe, "docs/packages/pkg-1/values.md"),
+            "Big Bang page": (
+                append("submodules/bigbang/docs/guide.md"),
+                "docs/docs/guide.md",
+            ),
+            "package tag": (bump, "docs/packages/pkg-0/README.md"),
+        }
+        failed = False
+        for name, (edit, output) in edits.items():
+            before = os.stat(output).st_mtime_ns if os.path.exists(output) else 0
+            edit()
+            start = time.perf_counter()
+            with captured():
+                changed = watcher.poll()
+            elapsed = time.perf_counter() - start
+            after = os.stat(output).st_mtime_ns if os.path.exists(output) else 0
+            report(f"{name} ({changed} changed)", [elapsed])
+            if changed == 0 or after == before:
+                print(f"[red]ERROR[/red]    - Editing a {name} didn't rebuild {output}")
+                failed = True
+            elif elapsed > budget:
+                print(
+                    f"[red]ERROR[/red]    - Editing a {name} took {elapsed:.3f}s to rebuild, over the {budget}s budget"
+                )
+                failed = True
+        corrupted = sorted(
+            str(path)
+            for path, digest in cached.items()
+            if not path.exists() or hashlib.sha256(path.read_bytes()).digest() != digest
+        )
+        if len(corrupted) > 0:
+            print(
+                f"[red]ERROR[/red]    - Rebuilds changed {len(corrupted)} file(s) of the build cache: {', '.join(corrupted[:5])}"
+            )
+            failed = True
+    if failed:
+        exit(1)
+
+
+def children_cpu():
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def differing_files(a, b):
+    """
+    Paths (relative to a and b) of the files only one of the trees has or whose bytes differ
+    """
+    files = {}
+    for root in (a, b):
+        for folder, _, names in os.walk(root):
+            for name in names:
+                rel = os.path.relpath(os.path.join(folder, name), root)
+                files.setdefault(rel, []).append(Path(root, rel).read_bytes())
+    return sorted(
+        rel for rel, data in files.items() if len(data) != 2 or data[0] != data[1]
+    )
+
+
+@bench.command()
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to render, as <packages>x<pages>, default (16x40)",
+    default="16x40",
+)
+@click.option(
+    "--shards",
+    help="Number of mkdocs processes to render with, default (4)",
+    default=4,
+    type=click.IntRange(min=2),
+)
+def render(size, shards):
+    """
+    Time `mkdocs build` of a fixture against a sharded build, and fail if their sites differ by a byte
+    """
+    from .shard import render_sharded
+
+    with fixture_work(size):
+        config = mkdocs_config("docs", site_config)
+        start, cpu = time.perf_counter(), children_cpu()
+        sp.run(
+            [
+                "mkdocs",
+                "build",
+                "--clean",
+                "--config-file",
+                str(config),
+                "--site-dir",
+                "serial",
+            ],
+            capture_output=True,
+            check=True,
+        )
+        report(
+            "mkdocs build",
+            [time.perf_counter() - start],
+            f", {children_cpu() - cpu:.2f}s of CPU",
+        )
+
+        start, cpu = time.perf_counter(), children_cpu()
+        result = render_sharded(config, "docs", "sharded", shards)
+        report(
+            f"{shards} shards",
+            [time.perf_counter() - start],
+            f", {children_cpu() - cpu:.2f}s of CPU over {os.cpu_count()} core(s)",
+        )
+        if result.returncode != 0:
+            raise click.ClickException(f"Sharded build failed\n{result.stderr}")
+        differing = differing_files("serial", "sharded")
+    if len(differing) > 0:
+        print(
+            f"[red]ERROR[/red]    - The sharded site differs from the serial one in {len(differing)} file(s): {', '.join(differing[:10])}"
+        )
+        exit(1)
+    print("INFO     - The sharded site is identical to the serial one")
+
+
+@bench.command()
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to build, as <packages>x<pages>, default (16x40)",
+    default="16x40",
+)
+def sparse(size):
+    """
+    Build a fixture from full and from `--sparse` clones, and fail if their docs differ by a byte
+
+    Also fails unless the sparse clones check out fewer files
+    """
+    packages, pages = (int(n) for n in size.strip().split("x"))
+    checked_out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = make_fixture(tmp, packages, pages, 10)
+        for name in ["full", "sparse"]:
+            work = make_work(Path(tmp) / name)
+            stages = compile_fixture(work, env, 4, False, name == "sparse")
+            checked_out[name] = 0
+            for _, dirs, files in os.walk(work / "submodules"):
+                dirs[:] = [d for d in dirs if d != ".git"]
+                checked_out[name] += len(files)
+            report(
+                f"{name} clones", [stages["total"]], f", {checked_out[name]} file(s)"
+            )
+        differing = differing_files(
+            Path(tmp, "full", "docs"), Path(tmp, "sparse", "docs")
+        )
+    if len(differing) > 0:
+        print(
+            f"[red]ERROR[/red]    - The docs of the sparse build differ in {len(differing)} file(s): {', '.join(differing[:10])}"
+        )
+        exit(1)
+    if checked_out["sparse"] >= checked_out["full"]:
+        print(
+            f"[red]ERROR[/red]    - The sparse clones checked out {checked_out['sparse']} file(s), no fewer than full ones"
+        )
+        exit(1)
+    print("INFO     - The docs of the sparse build are identical to the full one's")
+
+
+@bench.command("manifest")
+@click.option(
+    "-s",
+    "--size",
+    help="Fixture to render, as <packages>x<pages>, default (16x40)",
+    default="16x40",
+)
+@click.option(
+    "--shards",
+    help="Number of mkdocs processes to render with, default (1)",
+    default=1,
+)
+def manifest_(size, shards):
+    """
+    Time rendering a fixture with `--manifest`, then edit one page and fail unless the manifests' delta is what changed
+    """
+    import shutil
+
+    from .manifest import delta, load_manifest, write_manifest
+    from .publish import precompress
+    from .shard import render_sharded
+
+    errors = []
+    with fixture_work(size):
+        config = mkdocs_config("docs", site_config)
+        start = time.perf_counter()
+        sp.run(
+            [
+                "mkdocs",
+                "build",
+                "--config-file",
+                str(config),
+                "--site-dir",
+                "serial",
+            ],
+            capture_output=True,
+            check=True,
+        )
+        report("mkdocs build", [time.perf_counter() - start])
+
+        manifests = []
+        for name in ["old", "new"]:
+            files = {}
+            start = time.perf_counter()
+            result = render_sharded(config, "docs", "site", shards, files=files)
+            report(
+                f"{name}: rendered with a manifest",
+                [time.perf_counter() - start],
+                f", {len(files)} file(s)",
+            )
+            if result.returncode != 0:
+                raise click.ClickException(f"Build failed\n{result.stderr}")
+            if name == "old":
+                differing = differing_files("serial", "site")
+                errors += [f"'{f}' rendered differently" for f in differing]
+            with captured():
+                precompress("site", files=files)
+                write_manifest(f"{name}.json", files, "docs", "1.42.0")
+            manifests.append(load_manifest(f"{name}.json"))
+            if name == "old":
+                shutil.copytree("site", "old")
+                page = Path("docs/packages/pkg-0/docs/page1.md")
+                page.write_text(page.read_text() + "\nOne more paragraph.\n")
+
+            on_disk = set()
+            for folder, _, names in os.walk("site"):
+                for n in names:
+                    on_disk.add(os.path.relpath(os.path.join(folder, n), "site"))
+            listed = manifests[-1]["files"]
+            errors += [
+                f"'{f}' is missing from {name}.json" for f in on_disk - set(listed)
+            ]
+            for f, entry in listed.items():
+                data = Path("site", f).read_bytes()
+                if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+                    errors.append(f"'{f}' has another hash in {name}.json")
+
+        source = manifests[0]["files"]["packages/pkg-0/docs/page1/index.html"].get(
+            "source"
+        )
+        if (
+            source is None
+            or source["repo"] != "pkg-0"
+            or source["path"] != "docs/page1.md"
+        ):
+            errors.append(f"the source of pkg-0's page1 is {source}")
+        sourced = sum("source" in e for e in manifests[0]["files"].values())
+        added, changed, removed = delta(*manifests)
+        expected = differing_files("old", "site")
+    if sorted(added + changed + removed) != expected:
+        errors.append(
+            f"the delta lists {', '.join(sorted(added + changed + removed))} but {', '.join(expected)} changed"
+        )
+    print(
+        f"INFO     - {sourced} file(s) with a source, {len(added)} added, {len(changed)} changed, {len(removed)} removed after one page changed"
+    )
+    if len(errors) > 0:
+        print(
+            f"[red]ERROR[/red]    - {len(errors)} problem(s): {', '.join(errors[:5])}"
+        )
+        exit(1)
+    print(
+        "INFO     - Every file is in the manifest with its hash, the delta is what changed"
+    )
+
+
+def stand_in_repo1(requests):
+    """
+    Local stand-in for Repo1's releases API: tags have releases with an ETag, the ones ending in `missing` have
+    none, and `slow` doesn't answer in time. Every request is appended to `requests`
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            tag = self.path.rsplit("/", 1)[-1]
+            requests.append(tag)
+            if tag == "slow":
+                # the client has given up by then
+                time.sleep(2)
+                return
+            if tag.endswith("missing"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            etag = f'"{tag}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = json.dumps({"tag_name": tag, "description": f"notes for {tag}"})
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@bench.command()
+def http():
+    """
+    Check and time release notes fetching against a local stand-in for Repo1
+    """
+    requests = []
+    server = stand_in_repo1(requests)
+    api = f"http://127.0.0.1:{server.server_port}/api/v4"
+    failed = False
+
+    def check(name, fn, expected, n_requests):
+        nonlocal failed
+        before = len(requests)
+        start = time.perf_counter()
+        with captured():
+            result = fn()
+        elapsed = time.perf_counter() - start
+        made = len(requests) - before
+        if result == expected and made == n_requests:
+            print(f"INFO     - {name}: {elapsed * 1000:.1f}ms, {made} request(s)")
+        else:
+            print(
+                f"[red]ERROR[/red]    - {name}: got {result!r} with {made} request(s), expected {expected!r} with {n_requests}"
+            )
+            failed = True
+
+    with tempfile.TemporaryDirectory() as tmp, working_in(
+        tmp, {"BB_DOCS_REPO1_API": api}
+    ):
+        notes = "notes for 1.42.0"
+        check("Cold tag", lambda: get_release_notes("1.42.0"), notes, 1)
+        check("Cached tag", lambda: get_release_notes("1.42.0"), notes, 0)
+        branch = "notes for release-1.43.x"
+        check("Cold branch", lambda: get_release_notes("release-1.43.x"), branch, 1)
+        check(
+            "Revalidated branch (304)",
+            lambda: get_release_notes("release-1.43.x"),
+            branch,
+            1,
+        )
+        check("Missing release", lambda: get_release_notes("missing"), None, 1)
+        # only the 404 of a semver tag is kept, for a day
+        check("Missing release, again", lambda: get_release_notes("missing"), None, 1)
+        check(
+            "Missing tag release", lambda: get_release_notes("1.0.0-missing"), None, 1
+        )
+        check(
+            "Missing tag release, cached",
+            lambda: get_release_notes("1.0.0-missing"),
+            None,
+            0,
+        )
+        check("Offline, cached", lambda: get_release_notes("1.42.0", True), notes, 0)
+        check(
+            "Offline, not cached",
+            lambda: get_release_notes("1.43.0", True),
+            None,
+            0,
+        )
+        check(
+            "Timeout",
+            lambda: fetch.get(f"{api}/slow", timeout=(1, 0.2)),
+            (None, None),
+            3,
+        )
+        server.shutdown()
+        server.server_close()
+        check(
+            "Unreachable, cached branch",
+            lambda: get_release_notes("release-1.43.x"),
+            branch,
+            0,
+        )
+    if failed:
+        exit(1)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+
+import click
+
+from .log import print
+from .stage import stage_tree
+from .trace import traced
+
+
+def cache_dir(*parts):
+    """
+    Directory under `.cache` for build data that is safe to reuse between runs
+    """
+    path = Path.cwd().joinpath(".cache", *parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def touch_entry(entry):
+    """
+    Mark a cache entry as used, `bb-docs-cache prune` removes the ones that weren't for a while
+    """
+    os.utime(entry)
+
+
+def write_entry(entry, data):
+    """
+    Save data as the file cache entry, readers never see a partly written entry
+    """
+    tmp = entry.with_name(f".{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(entry)
+
+
+def prune_dir(kind, max_age):
+    """
+    Remove the entries of `.cache/<kind>` not used in the last max_age seconds, returns how many
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in cache_dir(kind).iterdir():
+        if entry.stat().st_mtime < cutoff:
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+@lru_cache(maxsize=None)
+def compiler_version():
+    """
+    Installed version of the compiler plus a hash of its source, so editing the compiler invalidates cached output
+    """
+    try:
+        version = metadata.version("docs-compiler")
+    except metadata.PackageNotFoundError:
+        version = "0.0.0"
+    digest = hashlib.sha256()
+    for f in sorted(Path(__file__).parent.rglob("*")):
+        if f.is_file() and f.suffix in (".py", ".j2", ".html"):
+            digest.update(f.read_bytes())
+    return f"{version}+{digest.hexdigest()[:12]}"
+
+
+def build_key(*parts):
+    """
+    Content address for compiled output, `parts` must be json serializable
+    """
+    data = json.dumps([compiler_version(), *parts], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+@traced("cache")
+def restore_build(key, dst):
+    """
+    Stage the cached output for `key` in dst, returns False on a cache miss
+    """
+    entry = cache_dir("build") / key
+    if not entry.is_dir():
+        return False
+    stage_tree(entry, dst)
+    touch_entry(entry)
+    return True
+
+
+@traced("cache")
+def store_build(key, src, kind="build"):
+    """
+    Save the compiled output in src under `key` in `.cache/<kind>`, returns the entry
+    """
+    entry = cache_dir(kind) / key
+    if entry.is_dir():
+        return entry
+    tmp = entry.with_name(f".{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    stage_tree(src, tmp)
+    try:
+        tmp.rename(entry)
+    except OSError:
+        # another build stored the same key first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return entry
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+def cache():
+    pass
+
+
+@cache.command()
+@click.option(
+    "--days",
+    help="Remove compiled packages, formatted and compressed files not used in the last <days> days, default (30)",
+    default=30,
+    type=click.IntRange(min=0),
+)
+@click.option("--all", "everything", help="Remove the whole `.cache`", is_flag=True)
+def prune(days, everything):
+    if everything:
+        shutil.rmtree(Path.cwd() / ".cache", ignore_errors=True)
+        print("INFO     - Removed `.cache`")
+        return
+    max_age = days * 24 * 60 * 60
+    for kind, what in [
+        ("build", "compiled package(s)"),
+        ("prettier", "formatted file(s)"),
+        ("gzip", "compressed file(s)"),
+    ]:
+        removed = prune_dir(kind, max_age)
+        print(f"INFO     - Removed {removed} {what} from `.cache/{kind}`")
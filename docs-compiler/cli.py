@@ -1,90 +1,245 @@
-import glob
 import os
 import shutil
 import subprocess as sp
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
 
 import click
-import semver
-from deepmerge import always_merger as merge
-from git import GitCommandError
-from rich import print
-from rich.console import Console
-from ruamel.yaml import YAML
 
+from .cache import build_key, cache_dir, restore_build, store_build
+from .linkgraph import link_pages, report_broken, site_index
+from .log import captured, console, flush, print
+from .manifest import version_path, write_manifest, write_sources
+from .nav import mkdocs_config, site_config, write_nav
+from .pipeline import Document, Pipeline, remove_gitlab_toc
 from .prenpost import cleanup, postflight, preflight
-from .repo import BigBangRepo, SubmoduleRepo
-from .utils import (
-    add_frontmatter,
-    get_release_notes,
+from .repo import BigBangRepo, MissingRefError, SubmoduleRepo, git_summary, repo_pool
+from .stage import dedupe_assets, materialize, stage_tree
+from .trace import count, record, span, summary, traced, write_trace
+from .utils import add_frontmatter, get_release_notes, tree_index
+from .values import (
+    dumps_values_json,
+    parse_values,
     parse_values_table_from_helm_docs,
     patch_values_table_from_helm_docs,
-    write_values_md,
+    render_values_md,
 )
 
-yaml = YAML(typ="rt")
-# indent 2 spaces extra on lists
-yaml.indent(mapping=2, sequence=4, offset=2)
-# prevent opinionated line wrapping
-yaml.width = 1000
-c = Console()
 
+def new_yaml():
+    from ruamel.yaml import YAML
 
-def compile(bb, tag):
-    docs_root = Path().cwd() / "docs"
+    # YAML instances are not thread-safe, so each package worker makes its own
+    yaml = YAML(typ="rt")
+    # indent 2 spaces extra on lists
+    yaml.indent(mapping=2, sequence=4, offset=2)
+    # prevent opinionated line wrapping
+    yaml.width = 1000
+    return yaml
 
+
+def load_config():
     with Path().cwd().joinpath("docs-compiler.yaml").open("r") as f:
-        meta = yaml.load(f)
+        return new_yaml().load(f)
 
-    ## bigbang section
+
+def sparse_paths(pkg, pkg_config):
+    """
+    Paths a package needs checked out, relative to its repo root, or None if its `source` is outside of the repo
+    """
+    repo_root = Path().cwd() / "submodules" / pkg
+    src_root = Path().cwd().joinpath(pkg_config["source"])
+    try:
+        prefix = src_root.relative_to(repo_root)
+    except ValueError:
+        return None
+    # README.md has the values table
+    paths = [(prefix / p).as_posix() for p in [*pkg_config["include"], "README.md"]]
+    return list(dict.fromkeys(paths))
+
+
+@traced("acquire")
+def acquire_repos(pkgs, pkg_configs, jobs, sparse=False, offline=False, known=None):
+    """
+    Clone every package repo and make sure its tag is local, on a pool of `jobs` workers
+
+    Only missing refs are fetched, see `SubmoduleRepo.resolve`. Repos in `known` (by package) are reused.
+    Returns the repos that are ready and the errors of the ones that aren't, both keyed by package
+    """
+
+    def acquire(pkg):
+        with captured() as buf:
+            try:
+                paths = sparse_paths(pkg, pkg_configs[pkg]) if sparse else None
+                repo = (known or {}).get(pkg)
+                if repo is None or repo.sparse != paths:
+                    repo = SubmoduleRepo(
+                        pkgs[pkg]["name"], pkgs[pkg]["repo"], paths, offline
+                    )
+                repo.resolve(pkgs[pkg]["tag"])
+                err = None
+            except MissingRefError as e:
+                print(f"[red]ERROR[/red]    - {e}")
+                repo, err = None, e
+            except Exception as e:
+                print(
+                    f"[red]ERROR[/red]    - Failed to fetch '{pkg}': {e}\n{traceback.format_exc()}"
+                )
+                repo, err = None, e
+        return buf, repo, err
+
+    repos, errors = {}, {}
+    with console().status(f"Fetching {len(pkgs)} packages...", spinner="aesthetic"):
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {pkg: pool.submit(acquire, pkg) for pkg in pkgs}
+            for pkg, future in futures.items():
+                buf, repo, err = future.result()
+                flush(buf)
+                if err is None:
+                    repos[pkg] = repo
+                else:
+                    errors[pkg] = err
+    return repos, errors
+
+
+def compile_pkg(pkg, pkgs, pkg_config, repo, docs_root, use_cache=True, built=None):
+    """
+    `built` maps the build key of each package compiled earlier in a batch to a copy of its output from before
+    the site's links were rewritten, those are staged from it instead
+    """
     print()
-    c.rule(f"{bb.name}@{bb.ref}")
+    console().rule(f"\n{repo.name}@{pkgs[pkg]['tag']}\n")
     print()
-    bb_config = meta["/"]
-    notes = get_release_notes(tag)
-    if notes != None:
-        bb_config["pages"]["nav"][4]["📋 Release Notes"] = "release-notes.md"
-        with open("docs/release-notes.md", "w") as f:
-            f.write(notes)
-            f.close()
-    bb.copy_files(
-        Path().cwd() / "submodules" / "bigbang", docs_root, bb_config["include"]
-    )
-    with Path(docs_root / ".pages").open("w") as f:
-        yaml.dump(bb_config["pages"], f)
+    dst_root = docs_root / "packages" / pkg
+    os.makedirs(dst_root)
 
-    bb_values_table = parse_values_table_from_helm_docs(
-        "submodules/bigbang/docs/understanding-bigbang/configuration/base-config.md",
-        r"## Values(.*)",
+    # everything the compiled package depends on
+    key = build_key(repo.resolve(pkgs[pkg]["tag"]), pkgs[pkg], pkg_config)
+    if built is not None and key in built:
+        stage_tree(built[key], dst_root)
+        print(f"INFO     - Reused '{pkg}' from an earlier version in this batch")
+        return
+    if use_cache and restore_build(key, dst_root):
+        print(f"INFO     - Restored '{pkg}' from the build cache")
+        if built is not None:
+            built[key] = cache_dir("build") / key
+        return
+
+    repo.checkout(pkgs[pkg]["tag"])
+    src_root = Path().cwd().joinpath(pkg_config["source"])
+    markdown = repo.copy_files(src_root, dst_root, pkg_config["include"])
+
+    values_table, values_doc = pkg_values(pkg, src_root, dst_root)
+    docs = [Document.load(src, dst) for src, dst in markdown]
+    docs.append(values_doc)
+    index = tree_index(dst_root) | {os.path.normpath(doc.path) for doc in docs}
+    Pipeline(pkg_transforms(pkg, pkgs, repo, dst_root, index, values_table)).run(docs)
+
+    if use_cache or built is not None:
+        # dst_root is rewritten once the whole site is compiled, `--no-cache` batches keep theirs in `.cache/batch`
+        entry = store_build(key, dst_root, "build" if use_cache else "batch")
+        if built is not None:
+            built[key] = entry
+
+
+def pkg_values(pkg, src_root, dst_root):
+    """
+    Values of a package from the table in its README, writes its values.json
+
+    Returns the table (for `pkg_transforms`) and the package's values.md
+    """
+    values_table = parse_values_table_from_helm_docs(
+        src_root / "README.md",
+        r"## Values(.*?)## Contributing",
     )
+    values = parse_values(values_table)
+    # staged from the build cache when the package was restored, `--dev` writes it again
+    materialize(dst_root / "values.json")
+    (dst_root / "values.json").write_text(dumps_values_json(values))
+    return values_table, Document(dst_root / "values.md", render_values_md(values, pkg))
 
-    write_values_md("docs/values.md", bb_values_table, "Big Bang")
 
-    root_level_md = glob.iglob("docs/*.md")
-    for md in root_level_md:
-        if md == "docs/about.md" or md == "docs/values.md":
-            add_frontmatter(
-                md,
-                {
-                    "hide": ["navigation"],
-                },
-            )
+def pkg_transforms(pkg, pkgs, repo, dst_root, index, values_table):
+    """
+    What every document of a package goes through, in order, see `Pipeline`
+    """
+
+    def pkg_frontmatter(doc):
+        if doc.path == dst_root / "values.md":
+            add_frontmatter(doc, {"tags": ["values", pkg, pkgs[pkg]["tag"]]})
         else:
             add_frontmatter(
-                md,
+                doc,
                 {
-                    "hide": ["navigation"],
-                    "revision_date": bb.get_revision_date(md.replace("docs/", "", 1)),
+                    "tags": ["package", pkg, pkgs[pkg]["tag"]],
+                    "revision_date": repo.get_revision_date(
+                        doc.path.relative_to(dst_root)
+                    ),
                 },
             )
 
-    bb.patch_external_refs("**/*.md", docs_root)
+    def pkg_values_table(doc):
+        if doc.path == dst_root / "README.md":
+            patch_values_table_from_helm_docs(doc, values_table)
+
+    return [
+        lambda doc: repo.patch_external_refs(doc, dst_root, index),
+        pkg_frontmatter,
+        pkg_values_table,
+        remove_gitlab_toc,
+    ]
+
+
+def compile_pkgs(pkgs, pkg_configs, repos, docs_root, jobs, use_cache=True, built=None):
+    """
+    Compile every package on a pool of `jobs` workers
+
+    Packages write to their own `docs/packages/<pkg>` tree, so the only thing the workers share is the console,
+    each one buffers its output and it gets printed in package order once that package is done
+    """
+
+    def run(pkg):
+        with captured() as buf, span(pkg, cat="package"):
+            try:
+                compile_pkg(
+                    pkg,
+                    pkgs,
+                    pkg_configs[pkg],
+                    repos[pkg],
+                    docs_root,
+                    use_cache,
+                    built,
+                )
+                err = None
+            except Exception as e:
+                print(
+                    f"[red]ERROR[/red]    - Failed to compile '{pkg}': {e}\n{traceback.format_exc()}"
+                )
+                err = e
+        return buf, err
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pkg: pool.submit(run, pkg) for pkg in repos}
+        for pkg, future in futures.items():
+            buf, err = future.result()
+            flush(buf)
+            if err is not None:
+                errors[pkg] = err
+    return errors
+
+
+def package_configs(meta, pkgs):
+    """
+    Entry of each package in `docs-compiler.yaml`, merged over `_template`
+    """
+    from deepmerge import always_merger as merge
 
     template_config = meta["packages"]["_template"]
-    del meta["packages"]["_template"]
-    pkgs = bb.get_pkgs()
+    pkg_configs = {}
     for pkg in pkgs:
         tmpl = deepcopy(template_config)
         try:
@@ -92,68 +247,332 @@ def compile(bb, tag):
         except KeyError:
             pkg_config = tmpl
             pkg_config["source"] = "submodules/" + pkg
-        repo = SubmoduleRepo(pkgs[pkg]["name"], pkgs[pkg]["repo"])
-        repo.checkout(pkgs[pkg]["tag"])
-        print()
-        c.rule(f"\n{repo.name}@{repo.ref}\n")
-        print()
-        dst_root = docs_root / "packages" / pkg
-        os.makedirs(dst_root)
-        src_root = Path().cwd().joinpath(pkg_config["source"])
-        repo.copy_files(src_root, dst_root, pkg_config["include"])
-        with Path(dst_root / ".pages").open("w") as f:
-            yaml.dump(pkg_config["pages"], f)
-        repo.patch_external_refs("**/*.md", dst_root)
-
-        for md in dst_root.glob("**/*.md"):
+        pkg_configs[pkg] = pkg_config
+    return pkg_configs
+
+
+def bb_values(docs_root):
+    """
+    Big Bang's values.md from the table in its base config docs, writes its values.json
+    """
+    bb_values_table = parse_values_table_from_helm_docs(
+        "submodules/bigbang/docs/understanding-bigbang/configuration/base-config.md",
+        r"## Values(.*)",
+    )
+    bb_values = parse_values(bb_values_table)
+    materialize(docs_root / "values.json")
+    (docs_root / "values.json").write_text(dumps_values_json(bb_values))
+    return Document(docs_root / "values.md", render_values_md(bb_values, "Big Bang"))
+
+
+def bb_transforms(bb, tag, docs_root, index):
+    """
+    What every document of Big Bang goes through, in order, see `Pipeline`
+    """
+
+    def bb_frontmatter(doc):
+        md = doc.path.relative_to(docs_root)
+        if md.name in ("about.md", "values.md") and len(md.parts) == 1:
+            add_frontmatter(doc, {"hide": ["navigation"]})
+        elif len(md.parts) == 1:
             add_frontmatter(
-                md,
+                doc,
                 {
-                    "tags": ["package", pkg, pkgs[pkg]["tag"]],
-                    "revision_date": repo.get_revision_date(md.relative_to(dst_root)),
+                    "hide": ["navigation"],
+                    "revision_date": bb.get_revision_date(md),
                 },
             )
+        elif md.parts[0] == "docs":
+            add_frontmatter(
+                doc,
+                {
+                    "tags": ["bigbang", tag],
+                    "revision_date": bb.get_revision_date(md),
+                },
+            )
+
+    return [
+        lambda doc: bb.patch_external_refs(doc, docs_root, index),
+        bb_frontmatter,
+        remove_gitlab_toc,
+    ]
+
+
+def bb_nav(meta, docs_root):
+    """
+    Big Bang's nav from `docs-compiler.yaml`, with the release notes page when it was fetched
+    """
+    nav = deepcopy(meta["/"]["pages"]["nav"])
+    if (Path(docs_root) / "release-notes.md").exists():
+        nav[4]["📋 Release Notes"] = "release-notes.md"
+    return nav
 
-        values_table = parse_values_table_from_helm_docs(
-            src_root / "README.md",
-            r"## Values(.*?)## Contributing",
+
+def link_site(bb, pkgs, meta, docs_root, pages=None):
+    """
+    Resolve the links of pages (default all of them) against every file compiled to docs_root, see `linkgraph`
+
+    Returns the links that don't resolve. Where each file came from is written for the `manifest` as well
+    """
+    upstreams = {bb.name: bb.upstream}
+    upstreams.update({pkg: pkgs[pkg]["repo"] for pkg in pkgs})
+    index = site_index(docs_root, upstreams, meta["/"]["include"])
+    # Big Bang's packages page is the packages index too
+    index.add(bb.name, "docs/packages.md", "packages/index.md")
+    index.track(bb.name, bb.upstream, bb.ref, bb.tracked_paths())
+    refs = {bb.name: bb.ref}
+    refs.update({pkg: pkgs[pkg]["tag"] for pkg in pkgs})
+    write_sources(index, refs, docs_root)
+    return link_pages(index, pages)
+
+
+def compile(
+    bb,
+    tag,
+    jobs=1,
+    use_cache=True,
+    sparse=False,
+    fetch_jobs=4,
+    offline=False,
+    docs_root=None,
+    repos=None,
+    built=None,
+    link_report=None,
+):
+    """
+    Compile Big Bang at `tag` and all of its packages to docs_root, default (docs)
+
+    `repos` and `built` carry package repos and compiled packages over between the versions of a batch,
+    links that don't resolve are printed and written to `link_report` as json if given
+    """
+    docs_root = Path(docs_root or Path().cwd() / "docs")
+    meta = load_config()
+
+    pkgs = bb.get_pkgs()
+    pkg_configs = package_configs(meta, pkgs)
+
+    known = repos
+    repos, errors = acquire_repos(pkgs, pkg_configs, fetch_jobs, sparse, offline, known)
+    if known is not None:
+        known.update(repos)
+    if len(errors) > 0:
+        print(
+            f"[red]ERROR[/red]    - Failed to fetch {len(errors)} package(s): {', '.join(errors)}"
         )
-        patch_values_table_from_helm_docs(
-            f"docs/packages/{pkg}/README.md", values_table
+        exit(1)
+
+    ## bigbang section
+    with span(bb.name, cat="package"):
+        print()
+        console().rule(f"{bb.name}@{bb.ref}")
+        print()
+        bb_config = meta["/"]
+        markdown = bb.copy_files(
+            Path().cwd() / "submodules" / "bigbang", docs_root, bb_config["include"]
         )
-        write_values_md(f"docs/packages/{pkg}/values.md", values_table, pkg)
-        add_frontmatter(
-            f"docs/packages/{pkg}/values.md",
-            {"tags": ["values", pkg, pkgs[pkg]["tag"]]},
+        docs = [Document.load(src, dst) for src, dst in markdown]
+        docs.append(Document.load(docs_root / "about.md"))
+
+        notes = get_release_notes(tag, offline)
+        if notes != None:
+            docs.append(Document(docs_root / "release-notes.md", notes))
+
+        docs.append(bb_values(docs_root))
+        index = tree_index(docs_root) | {os.path.normpath(doc.path) for doc in docs}
+        Pipeline(bb_transforms(bb, tag, docs_root, index)).run(docs)
+
+    errors = compile_pkgs(pkgs, pkg_configs, repos, docs_root, jobs, use_cache, built)
+    if len(errors) > 0:
+        print(
+            f"[red]ERROR[/red]    - Failed to compile {len(errors)} package(s): {', '.join(errors)}"
         )
+        exit(1)
 
-    shutil.copy2(
-        "submodules/bigbang/docs/packages.md",
-        "docs/packages/index.md",
+    Pipeline([remove_gitlab_toc]).run(
+        [
+            Document.load(
+                "submodules/bigbang/docs/packages.md",
+                docs_root / "packages" / "index.md",
+            )
+        ]
     )
 
-    with c.status(f"Adding tags to Big Bang docs...", spinner="aesthetic"):
-        bb_docs = docs_root.glob("docs/**/*.md")
-        for md in bb_docs:
-            add_frontmatter(
-                md,
-                {
-                    "tags": ["bigbang", tag],
-                    "revision_date": bb.get_revision_date(md.relative_to(docs_root)),
-                },
+    with console().status("Resolving links...", spinner="aesthetic"):
+        broken = link_site(bb, pkgs, meta, docs_root)
+    report_broken(broken, link_report)
+
+    with console().status("Resolving the nav...", spinner="aesthetic"):
+        write_nav(docs_root, bb_nav(meta, docs_root), pkg_configs)
+
+
+def report_trace(path):
+    summary()
+    write_trace(path)
+    print(
+        f"INFO     - Trace written to {path}, open it in chrome://tracing or https://ui.perfetto.dev"
+    )
+
+
+def check_tag(ref):
+    """
+    Exit unless ref is a semver tag this docs generator supports
+    """
+    import semver
+
+    try:
+        ver = semver.VersionInfo.parse(ref)
+        if ver.major == 1 and ver.minor <= 40:
+            print(
+                "[red]ERROR[/red]    - Only versions 1.40.0+ are supported via this docs generator"
             )
+            exit(1)
+    except ValueError:
+        print(
+            f"[red]ERROR[/red]    - Tag '{ref}' provided is not a valid semver string"
+        )
+        exit(1)
 
-    with c.status(f"Creating docs/packages/.pages...", spinner="aesthetic"):
-        # patch packages nav
-        with open("docs/packages/.pages", "w") as f:
-            dot_pages = {}
-            dot_pages["nav"] = [{"Home": "index.md"}]
-            sorted_pkgs = sorted(pkgs)
-            for pkg in sorted_pkgs:
-                dot_pages["nav"].append({pkg: pkg})
-            yaml.dump(dot_pages, f)
-            f.close()
-        # end patch
+
+def render_version(version, docs_root, site_dir, shards=1, files=None):
+    """
+    `mkdocs build` one version of a batch, from its own docs to its own site folder
+
+    files gets the `manifest` entries of the site if given
+    """
+    # relative paths in mkdocs.yml resolve against the config file, so it has to sit next to it
+    config = mkdocs_config(docs_root, Path().cwd() / f".mkdocs-{version}.yml", site_dir)
+    try:
+        if shards > 1 or files is not None:
+            from .shard import render_sharded
+
+            return render_sharded(
+                config,
+                docs_root,
+                site_dir,
+                shards,
+                {"MIKE_DOCS_VERSION": version},
+                files,
+            )
+        with span("mkdocs", version=version):
+            count(subprocess=1)
+            return sp.run(
+                ["mkdocs", "build", "--clean", "--config-file", str(config)],
+                capture_output=True,
+                encoding="utf-8",
+                env={**os.environ, "MIKE_DOCS_VERSION": version},
+            )
+    finally:
+        config.unlink()
+
+
+def compile_versions(
+    bb,
+    versions,
+    latest,
+    outdir,
+    jobs=1,
+    use_cache=True,
+    sparse=False,
+    fetch_jobs=4,
+    offline=False,
+    build=True,
+    dedupe=False,
+    shards=1,
+    precompress=False,
+    manifest=None,
+):
+    """
+    Compile several Big Bang versions, render them in parallel and deploy each one with mike
+
+    The versions share their package repos, and a package pinned to the same tag as in an earlier version
+    is copied from it instead of compiled again. `latest` gets the `latest` alias if it is in the batch, and
+    every version gets its own `manifest` next to the path given
+    """
+    repos, built, roots = {}, {}, {}
+    shutil.rmtree(cache_dir("batch"), ignore_errors=True)
+    for version in versions:
+        try:
+            bb.checkout(version)
+        except MissingRefError:
+            print(
+                f"[red]ERROR[/red]    - Failed to checkout ({version}) on bigbang, verify branch/tag exists in Repo1"
+            )
+            exit(1)
+        print(f"INFO     - Compiling docs for Big Bang version '{version}'")
+        roots[version] = cache_dir("versions") / version
+        with span(version, cat="version"):
+            preflight(bb, roots[version])
+            compile(
+                bb,
+                version,
+                jobs,
+                use_cache,
+                sparse,
+                fetch_jobs,
+                offline,
+                roots[version],
+                repos,
+                built,
+            )
+            postflight(roots[version])
+    # nothing reads the repos while the versions render
+    repo_pool.close()
+    shutil.rmtree(cache_dir("batch"), ignore_errors=True)
+
+    if dedupe:
+        # only once every version is compiled, later versions stage packages from earlier ones
+        for version in versions:
+            dedupe_assets(roots[version])
+
+    if build == False:
+        print("INFO     - Documentation compiled to `.cache/versions`")
+        return
+
+    from mike import commands
+    from mkdocs.config import load_config as load_mkdocs_config
+
+    sites = {v: Path(outdir).resolve() / v for v in versions}
+    files = {v: {} if manifest else None for v in versions}
+    with console().status(
+        f"Rendering {len(versions)} versions...", spinner="aesthetic"
+    ):
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                v: pool.submit(render_version, v, roots[v], sites[v], shards, files[v])
+                for v in versions
+            }
+            results = {v: future.result() for v, future in futures.items()}
+    for version, result in results.items():
+        if result.returncode != 0:
+            print(
+                f"[red]ERROR[/red]    - Failed to render '{version}'\n{result.stderr}"
+            )
+            exit(1)
+    if precompress:
+        from .publish import precompress as precompress_site
+
+        for version in versions:
+            precompress_site(sites[version], files=files[version])
+    if manifest:
+        for version in versions:
+            write_manifest(
+                version_path(manifest, version),
+                files[version],
+                roots[version],
+                version,
+                version,
+            )
+
+    # every deploy is a commit on the same branch, so these go one at a time
+    for version in versions:
+        aliases = ["latest"] if version == latest else []
+        cfg = load_mkdocs_config("mkdocs.yml", site_dir=str(sites[version]))
+        with commands.deploy(cfg, version, aliases=aliases, update_aliases=True):
+            pass
+        print(
+            f"INFO     - Deployed '{version}'"
+            + (f" as '{', '.join(aliases)}'" if aliases else "")
+        )
 
 
 @click.command(
@@ -190,9 +609,101 @@ def compile(bb, tag):
     help="Compile the `docs` folder but do not render w/ mkdocs",
     is_flag=True,
 )
-@click.option("-d", "--dev", help="Run `mkdocs serve` after build", is_flag=True)
-def compiler(tag, branch, pre_release, clean, outdir, no_build, dev):
+@click.option(
+    "-d",
+    "--dev",
+    help="Run `mkdocs serve` after build, and recompile what changes in `submodules` / `base`",
+    is_flag=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="Number of packages to compile in parallel, default (1)",
+    default=1,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--no-cache",
+    help="Compile every package from scratch instead of restoring unchanged ones from `.cache`",
+    is_flag=True,
+)
+@click.option(
+    "--sparse",
+    help="Use blob-less clones and only check out the `include` paths of each repo",
+    is_flag=True,
+)
+@click.option(
+    "--tags",
+    help="Build a comma separated list of Big Bang tags and deploy each one with `mike`",
+    type=click.STRING,
+)
+@click.option(
+    "--trace",
+    help="Write a Chrome trace of the build to <trace> and print a summary of where the time went",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--link-report",
+    help="Write the links that don't resolve to any file, in the site or upstream, to <link_report> as json",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--dedupe-assets",
+    "dedupe",
+    help="Store identical images and other static assets once, under `static/cas`",
+    is_flag=True,
+)
+@click.option(
+    "--precompress",
+    help="Write `.gz` copies of scripts, styles and json, and content-hashed copies of `static`, for nginx",
+    is_flag=True,
+)
+@click.option(
+    "--manifest",
+    help="Write every file of the site with its hash and source to <manifest> as json, `<stem>-<version>.json` for each of `--tags`",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--shards",
+    help="Render the site in <shards> parallel mkdocs processes, each one building some of the packages, default (1)",
+    default=1,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--fetch-jobs",
+    help="Number of repos to clone / fetch in parallel, default (4)",
+    default=4,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--offline",
+    help="Only use repos and refs already in `submodules`, fail with what's missing",
+    is_flag=True,
+)
+def compiler(
+    tag,
+    branch,
+    pre_release,
+    clean,
+    outdir,
+    no_build,
+    dev,
+    jobs,
+    no_cache,
+    sparse,
+    tags,
+    trace,
+    link_report,
+    dedupe,
+    precompress,
+    manifest,
+    shards,
+    fetch_jobs,
+    offline,
+):
     time_start = time.time()
+    if trace:
+        record()
     ref = None
     if (
         tag != "latest"
@@ -206,25 +717,64 @@ def compiler(tag, branch, pre_release, clean, outdir, no_build, dev):
             f"[red]ERROR[/red]    - Please use either '--branch' or '--tag' or '--pre-release', not a combination"
         )
         exit(1)
-    bb = BigBangRepo()
-    tags = bb.get_tags()
+    if manifest and (dev or no_build):
+        print(
+            f"[red]ERROR[/red]    - '--manifest' needs a rendered site, it can't be combined with '--dev' or '--no-build'"
+        )
+        exit(1)
+    versions = [t.strip() for t in tags.split(",") if t.strip()] if tags else []
+    if len(versions) > 0 and (
+        tag != "latest" or branch or pre_release or dev or link_report
+    ):
+        print(
+            f"[red]ERROR[/red]    - '--tags' can't be combined with '--tag', '--branch', '--pre-release', '--dev' or '--link-report'"
+        )
+        exit(1)
+    try:
+        bb = BigBangRepo(load_config()["/"]["include"] if sparse else None, offline)
+    except MissingRefError as e:
+        print(f"[red]ERROR[/red]    - {e}")
+        exit(1)
+    if tag == "latest" or pre_release or len(versions) > 0:
+        # the batch's `latest` alias goes to the newest release upstream, not the newest one that is local
+        bb.refresh_tags()
+        tags = bb.get_tags()
+
+    if len(versions) > 0:
+        for version in versions:
+            check_tag(version)
+        compile_versions(
+            bb,
+            versions,
+            tags[0],
+            outdir,
+            jobs,
+            not no_cache,
+            sparse,
+            fetch_jobs,
+            offline,
+            not no_build,
+            dedupe,
+            shards,
+            precompress,
+            manifest,
+        )
+        time_taken = time.time() - time_start
+        print(
+            f"INFO     - Batch of {len(versions)} versions completed in {time_taken.__round__(2)} seconds"
+        )
+        print(git_summary())
+        if trace:
+            report_trace(trace)
+        if clean:
+            cleanup()
+        return
 
     if tag == "latest":
         ref = tags[0]
     if tag != "latest":
         ref = tag
-        try:
-            ver = semver.VersionInfo.parse(ref)
-            if ver.major == 1 and ver.minor <= 40:
-                print(
-                    "[red]ERROR[/red]    - Only versions 1.40.0+ are supported via this docs generator"
-                )
-                exit(1)
-        except ValueError:
-            print(
-                f"[red]ERROR[/red]    - Tag '{ref}' provided is not a valid semver string"
-            )
-            exit(1)
+        check_tag(ref)
     elif branch:
         ref = branch
     elif pre_release:
@@ -232,40 +782,106 @@ def compiler(tag, branch, pre_release, clean, outdir, no_build, dev):
         ref = next_release_tag_x
         try:
             bb.checkout(next_release_tag_x)
-        except GitCommandError as e:
-            if "did not match any file(s) known to git" in e.stderr:
-                print(
-                    f"[red]ERROR[/red]    - Failed to checkout ({next_release_tag_x}) on bigbang, verify you have correctly run R2-D2"
-                )
-                exit(1)
-
-    ### TEMP MANUAL OVERRIDE TO USE git commit w/ fully up-to-date nav elements
-    ref = "f2b5f0ec3792bdd29846a100962ab73b2803cefb"
-
-    try:
-        bb.checkout(ref)
-    except GitCommandError as e:
-        if "did not match any file(s) known to git" in e.stderr:
+        except MissingRefError:
             print(
-                f"[red]ERROR[/red]    - Failed to checkout ({ref}) on bigbang, verify branch/tag exists in Repo1"
+                f"[red]ERROR[/red]    - Failed to checkout ({next_release_tag_x}) on bigbang, verify you have correctly run R2-D2"
             )
             exit(1)
 
+    try:
+        bb.checkout(ref)
+    except MissingRefError:
+        print(
+            f"[red]ERROR[/red]    - Failed to checkout ({ref}) on bigbang, verify branch/tag exists in Repo1"
+        )
+        exit(1)
+
     print(f"INFO     - Compiling docs for Big Bang version '{ref}'")
     preflight(bb)
-    compile(bb, ref)
+    repos = {}
+    compile(
+        bb,
+        ref,
+        jobs,
+        not no_cache,
+        sparse,
+        fetch_jobs,
+        offline,
+        repos=repos,
+        link_report=link_report,
+    )
     postflight()
+    # `--dev` opens the handles it needs again
+    repo_pool.close()
+    if dedupe:
+        dedupe_assets("docs")
+    config = mkdocs_config("docs", site_config)
+    # the `manifest` entries of the site, filled in as it is rendered
+    files = {} if manifest else None
 
     time_end = time.time()
     time_taken = time_end - time_start
     print(f"INFO     - Compilation completed in {time_taken.__round__(2)} seconds")
+    print(git_summary())
 
     if dev and no_build == False:
-        sp.run(["mkdocs", "serve"])
+        from .watch import Watch
+
+        # mkdocs serve reloads the pages the watcher rewrites
+        server = sp.Popen(
+            ["mkdocs", "serve", "--dirtyreload", "--config-file", str(config)]
+        )
+        try:
+            Watch(
+                bb,
+                ref,
+                jobs,
+                not no_cache,
+                sparse,
+                fetch_jobs,
+                offline,
+                repos,
+                config_file=config,
+            ).run()
+        finally:
+            server.terminate()
+            server.wait()
     elif no_build:
-        print("INFO     - Documentation compiled to `./docs`")
+        print(
+            f"INFO     - Documentation compiled to `./docs`, `mkdocs serve --config-file {config}` serves it"
+        )
+    elif shards > 1 or manifest:
+        from .shard import render_sharded
+
+        result = render_sharded(config, "docs", outdir, shards, files=files)
+        if result.stderr:
+            click.echo(result.stderr, err=True)
+        if result.returncode != 0:
+            print("[red]ERROR[/red]    - Failed to render the site")
+            exit(1)
     else:
-        sp.run(["mkdocs", "build", "--clean", "--site-dir", outdir])
+        with span("mkdocs"):
+            count(subprocess=1)
+            sp.run(
+                [
+                    "mkdocs",
+                    "build",
+                    "--clean",
+                    "--config-file",
+                    str(config),
+                    "--site-dir",
+                    outdir,
+                ]
+            )
+    if precompress and not (dev or no_build) and Path(outdir).is_dir():
+        from .publish import precompress as precompress_site
+
+        precompress_site(outdir, files=files)
+    if manifest:
+        write_manifest(manifest, files, "docs", ref)
+
+    if trace:
+        report_trace(trace)
 
     if clean:
         cleanup()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+
+from .cache import cache_dir, write_entry
+from .log import print
+from .trace import count, span
+
+# (connect, read) seconds, a slow or unreachable Repo1 fails the request instead of stalling the build
+timeout = (5, 30)
+# seconds a 404 for an immutable url is used without a request, its release can be published after its tag
+missing_max_age = 24 * 60 * 60
+
+
+def repo1_api():
+    """
+    Base URL of Repo1's REST API, `BB_DOCS_REPO1_API` points it at a stand-in server
+    """
+    return os.environ.get("BB_DOCS_REPO1_API", "https://repo1.dso.mil/api/v4")
+
+
+@lru_cache(maxsize=None)
+def session():
+    """
+    Pooled HTTP session, retries failed connections and gateway errors a couple of times
+    """
+    from requests import Session
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    s = Session()
+    retry = Retry(
+        total=2,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    s.mount("https://", HTTPAdapter(max_retries=retry))
+    s.mount("http://", HTTPAdapter(max_retries=retry))
+    return s
+
+
+def get(url, immutable=False, offline=False, timeout=timeout):
+    """
+    GET url through the on-disk cache in `.cache/http`, returns (status, text), or (None, None) if there is no answer
+
+    A cached `immutable` response is used without a request, a 404 for `missing_max_age`, anything else cached
+    is revalidated with its ETag / Last-Modified. `offline` only uses the cache, and a failed request falls back to it
+    """
+    from requests import RequestException
+
+    entry = cache_dir("http") / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+    cached = json.loads(entry.read_text()) if entry.exists() else None
+    if cached is not None and (
+        offline
+        or (immutable and cached["status"] == 200)
+        or (immutable and time.time() - entry.stat().st_mtime < missing_max_age)
+    ):
+        return cached["status"], cached["text"]
+    if offline:
+        return None, None
+
+    headers = {}
+    if cached is not None and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached is not None and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        with span("http", url=url):
+            count(http=1)
+            res = session().get(url, headers=headers, timeout=timeout)
+    except RequestException as e:
+        if cached is None:
+            print(f"[yellow]WARNING  -[/yellow] Request to {url} failed: {e}")
+            return None, None
+        print(
+            f"[yellow]WARNING  -[/yellow] Request to {url} failed, using the cached response: {e}"
+        )
+        return cached["status"], cached["text"]
+
+    if res.status_code == 304 and cached is not None:
+        return cached["status"], cached["text"]
+    if res.status_code == 200 or (res.status_code == 404 and immutable):
+        write_entry(
+            entry,
+            json.dumps(
+                {
+                    "url": url,
+                    "status": res.status_code,
+                    "etag": res.headers.get("ETag"),
+                    "last_modified": res.headers.get("Last-Modified"),
+                    "text": res.text,
+                }
+            ).encode(),
+        )
+    return res.status_code, res.text
@@ -0,0 +1,272 @@
+import os
+import shutil
+import subprocess as sp
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import click
+
+from . import cli
+from .log import captured
+from .nav import mkdocs_config, site_config
+from .prenpost import postflight, preflight
+from .repo import BigBangRepo
+from .trace import reset, span, totals
+
+# files from the compiler's repo that a build runs against
+work_files = ["docs-compiler.yaml", "mkdocs.yml"]
+work_dirs = ["base", "material-overrides", "scripts"]
+
+
+def values_table(keys):
+    rows = [
+        "| Key | Type | Default | Description |",
+        "|-----|------|---------|-------------|",
+    ]
+    for i in range(keys):
+        rows.append(f"| key{i}.enabled | bool | `true` | Toggle {i} |")
+        rows.append(f'| key{i}.obj | object | `{{"a":{i},"b":[1,2]}}` | Object {i} |')
+        rows.append(f'| key{i}.str | string | `"a\\|b\\nc"` | Piped {i} |')
+    return "\n".join(rows) + "\n"
+
+
+def package_files(name, pages, revision):
+    """
+    Tree of a package repo: a helm-docs README, nested docs with relative links, and a chart
+    """
+    files = {
+        "chart/values.yaml": f"revision: {revision}\n",
+        "chart/templates/deployment.yaml": "kind: Deployment\n",
+        "docs/img/diagram.png": "PNG" * 200,
+        "CONTRIBUTING.md": "# Contributing\n\nSee the [README](./README.md)\n",
+        "CHANGELOG.md": f"# Changelog\n\n## [{revision}]\n\n- see [docs](docs/page0.md)\n",
+        "README.md": (
+            f"# {name}\n\n[[_TOC_]]\n\n"
+            "See the [docs](docs/page0.md), [values](chart/values.yaml) "
+            "and [templates](./chart/templates/deployment.yaml#L1).\n\n"
+            f"## Values\n\n{values_table(20)}\n## Contributing\n\n"
+            "See [CONTRIBUTING](CONTRIBUTING.md)\n"
+        ),
+    }
+    for p in range(pages):
+        folder = "docs" if p % 4 else "docs/nested"
+        up = "" if folder == "docs" else "../"
+        meta = f"---\ntitle: Page {p}\n---\n\n" if p % 2 else ""
+        files[f"{folder}/page{p}.md"] = (
+            f"{meta}# Page {p}\n\n[[_TOC_]]\n\n"
+            f"[next]({up}page{(p + 1) % pages}.md) "
+            f"[anchor]({up}page{(p + 2) % pages}.md#section) "
+            f"[prefixed](docs/page{(p + 3) % pages}.md) "
+            f"[image]({up}img/diagram.png) "
+            f"[chart]({up}../chart/values.yaml) "
+            f"[missing](./missing-{p}.md)\n\n"
+            f"```yaml\n[not a link]({up}../chart/templates/deployment.yaml)\n```\n\n"
+            + "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 20
+            + f"\n## Section\n\nrevision {revision}\n"
+        )
+    return files
+
+
+def bigbang_files(pkgs):
+    values = "domain: bigbang.dev\n"
+    addons = "addons:\n"
+    for i, (name, url) in enumerate(pkgs.items()):
+        key = name.replace("-", "")
+        entry = f"{key}:\n  git:\n    repo: {url}\n    tag: 1.0.0-bb.0\n"
+        if i % 2:
+            # addons are nested one level deeper
+            addons += "".join(f"  {line}\n" for line in entry.splitlines())
+        else:
+            values += entry
+    # links to the repos of the packages, which are compiled into the site too
+    listing = "".join(
+        f"- [{name}]({url.removesuffix('.git')}) "
+        f"([docs]({url.removesuffix('.git')}/-/blob/main/docs/page1.md#section))\n"
+        for name, url in pkgs.items()
+    )
+    return {
+        "chart/values.yaml": values + addons,
+        "docs/packages.md": (
+            "# Packages\n\n[[_TOC_]]\n\nSee the [README](../README.md)\n\n" + listing
+        ),
+        "docs/understanding-bigbang/configuration/base-config.md": (
+            "# Base Config\n\n## Values\n\n" + values_table(10 * len(pkgs))
+        ),
+        "docs/guide.md": (
+            "# Guide\n\n[[_TOC_]]\n\n[values](../chart/values.yaml) "
+            "[config](understanding-bigbang/configuration/base-config.md)\n"
+        ),
+        "README.md": "# Big Bang\n\n[guide](docs/guide.md) [chart](./chart/values.yaml)\n",
+        "CHANGELOG.md": "# Changelog\n",
+        "CONTRIBUTING.md": "# Contributing\n",
+    }
+
+
+def fast_import_stream(tree, history, tag):
+    """
+    `git fast-import` input for `history` commits: the first adds the whole tree,
+    each one after that edits one of its markdown files, and the last is tagged
+    """
+    markdown = sorted(p for p in tree if p.endswith(".md"))
+    out = []
+
+    def blob(path, content):
+        data = content.encode()
+        out.append(
+            f"M 100644 inline {path}\ndata {len(data)}\n".encode() + data + b"\n"
+        )
+
+    for n in range(history):
+        when = 1640995200 + n * 3600
+        msg = f"revision {n}".encode()
+        out.append(
+            f"commit refs/heads/main\nmark :{n + 1}\n"
+            f"committer Dev {n % 5} <dev{n % 5}@bigbang.dev> {when} +0000\n"
+            f"data {len(msg)}\n".encode() + msg + b"\n"
+        )
+        if n == 0:
+            for path, content in tree.items():
+                blob(path, content)
+        else:
+            path = markdown[n % len(markdown)]
+            tree[path] += f"\nedited in revision {n}\n"
+            blob(path, tree[path])
+    out.append(f"reset refs/tags/{tag}\nfrom :{history}\n\n".encode())
+    return b"".join(out)
+
+
+def make_repo(path, tree, history, tag):
+    path.mkdir(parents=True)
+    sp.run(["git", "init", "--bare", "-q", "-b", "main"], cwd=path, check=True)
+    sp.run(
+        ["git", "fast-import", "--quiet"],
+        cwd=path,
+        input=fast_import_stream(dict(tree), max(history, 1), tag),
+        check=True,
+    )
+    # lets `--sparse` builds do partial clones
+    sp.run(["git", "config", "uploadpack.allowFilter", "true"], cwd=path, check=True)
+
+
+def make_work(work, src=None):
+    """
+    Copy of what a build needs from the compiler's repo (src, default the current directory) to build in
+    """
+    src = Path(src or Path.cwd())
+    work.mkdir(parents=True)
+    for f in work_files:
+        shutil.copy2(src / f, work / f)
+    for d in work_dirs:
+        shutil.copytree(src / d, work / d)
+    return work
+
+
+def make_fixture(root, packages, pages, history):
+    """
+    Build a synthetic Big Bang under root without touching the network, bare repos stand in for Repo1
+
+    Big Bang (tag `1.42.0`) pins `packages` packages (tag `1.0.0-bb.0`) with `pages` docs each,
+    every repo has `history` commits. Returns the environment that points git at the fixture instead of Repo1
+    """
+    upstream = "https://repo1.dso.mil/"
+    repo1 = Path(root) / "repo1"
+
+    pkgs = {}
+    for i in range(packages):
+        name = f"pkg-{i}"
+        path = repo1 / "platform-one" / "big-bang" / "apps" / f"{name}.git"
+        make_repo(path, package_files(name, pages, i), history, "1.0.0-bb.0")
+        pkgs[name] = f"{upstream}{path.relative_to(repo1).as_posix()}"
+    make_repo(
+        repo1 / "platform-one" / "big-bang" / "bigbang.git",
+        bigbang_files(pkgs),
+        history,
+        "1.42.0",
+    )
+
+    return {
+        **os.environ,
+        "GIT_CONFIG_COUNT": "2",
+        "GIT_CONFIG_KEY_0": f"url.{repo1.resolve().as_uri()}/.insteadOf",
+        "GIT_CONFIG_VALUE_0": upstream,
+        "GIT_CONFIG_KEY_1": "protocol.file.allow",
+        "GIT_CONFIG_VALUE_1": "always",
+    }
+
+
+@contextmanager
+def working_in(folder, env=None):
+    """
+    Run the block in folder with env added to the environment, both are put back after
+    """
+    cwd, environ = Path.cwd(), dict(os.environ)
+    os.chdir(folder)
+    os.environ.update(env or {})
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def compile_fixture(work, env, jobs, render, sparse=False):
+    """
+    One cold build of a fixture in work, with `--sparse` clones if sparse, returns the seconds spent per stage
+    """
+    with working_in(work, env):
+        reset()
+        start = time.perf_counter()
+        with captured():
+            meta = cli.load_config()
+            with span("acquire"):
+                bb = BigBangRepo(meta["/"]["include"] if sparse else None)
+            bb.checkout("1.42.0")
+            preflight(bb)
+            # clone everything first, so compile can run offline and skip the release notes API
+            pkgs = bb.get_pkgs()
+            _, errors = cli.acquire_repos(
+                pkgs, cli.package_configs(meta, pkgs), 4, sparse
+            )
+            if len(errors) > 0:
+                raise click.ClickException(f"Failed to clone {', '.join(errors)}")
+            cli.compile(bb, "1.42.0", jobs, sparse=sparse, offline=True)
+            postflight()
+            if render:
+                with span("mkdocs"):
+                    sp.run(
+                        [
+                            "mkdocs",
+                            "build",
+                            "--clean",
+                            "--config-file",
+                            str(mkdocs_config("docs", site_config)),
+                            "--site-dir",
+                            str(work / "site"),
+                        ],
+                        capture_output=True,
+                        check=True,
+                    )
+        stages = totals()
+        stages["total"] = time.perf_counter() - start
+        return stages
+
+
+@contextmanager
+def fixture_work(size, compiled=True, render=False, jobs=4):
+    """
+    Make the fixture `<packages>x<pages>` size in a temporary folder and run the block in a work folder for it,
+    with the fixture's environment. Yields (work, env), work is built cold first unless not compiled
+    """
+    packages, pages = (int(n) for n in size.strip().split("x"))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = make_fixture(tmp, packages, pages, 10)
+        # the sitemap's dates come from the clock otherwise, builds of a fixture must compare byte for byte
+        env["SOURCE_DATE_EPOCH"] = str(int(time.time()))
+        work = make_work(Path(tmp) / "work")
+        if compiled:
+            compile_fixture(work, env, jobs, render)
+        with working_in(work, env):
+            yield work, env
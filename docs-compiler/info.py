@@ -1,10 +1,8 @@
 import click
-from rich.console import Console
 
+from .log import print
 from .repo import BigBangRepo
 
-c = Console()
-
 
 @click.group()
 def info():
@@ -12,17 +10,25 @@ def info():
 
 
 @info.command()
-def all_bb_tags():
-    bb = BigBangRepo()
+@click.option(
+    "--offline", help="Only list tags already in `submodules/bigbang`", is_flag=True
+)
+def all_bb_tags(offline):
+    bb = BigBangRepo(offline=offline)
+    bb.refresh_tags()
     tags = bb.get_tags()
-    c.print(tags)
+    print(tags)
     return tags
 
 
 @info.command()
-def latest_bb_tag():
-    bb = BigBangRepo()
+@click.option(
+    "--offline", help="Only look at tags already in `submodules/bigbang`", is_flag=True
+)
+def latest_bb_tag(offline):
+    bb = BigBangRepo(offline=offline)
+    bb.refresh_tags()
     tags = bb.get_tags()
     latest = tags[0]
-    c.print(latest)
+    print(latest)
     return latest
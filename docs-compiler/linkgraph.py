@@ -0,0 +1,215 @@
+import json
+import os
+import posixpath
+import re
+from pathlib import Path
+
+from .links import patch_links
+from .log import print
+from .stage import materialize
+from .trace import count, traced
+
+# GitLab's anchor for a line or lines of a file, nothing a rendered page has
+line_anchor_regex = re.compile(r"L\d+(-L?\d+)?")
+# pages a folder link of a repo shows, in the order GitLab looks for them
+folder_pages = ("README.md", "index.md")
+
+
+def included(rel, include):
+    """
+    Whether rel (posix, relative to a repo) is one of the `include` entries or inside one of them
+    """
+    return any(rel == p or rel.startswith(p.rstrip("/") + "/") for p in include)
+
+
+def repo_key(url):
+    """
+    A repo's url without scheme, `.git` or trailing slash, the way links to it are written differ in those
+    """
+    url = url.split("://", 1)[-1].rstrip("/").lower()
+    return url.removesuffix(".git")
+
+
+def upstream_target(url):
+    """
+    (repo key, path, anchor) of a link to a repo or to a file / folder of it on GitLab, path is "" for the repo
+
+    Returns None for links to anything else of a repo (merge requests, releases, raw files, ...)
+    """
+    url, _, anchor = url.partition("#")
+    url = url.split("?", 1)[0].rstrip("/")
+    repo, sep, rest = url.partition("/-/")
+    path = ""
+    if sep:
+        kind, _, rest = rest.partition("/")
+        if kind not in ("blob", "tree"):
+            return None
+        # branches with a slash in their name aren't told apart from the path, like GitLab's own short links
+        _, _, path = rest.partition("/")
+    return repo_key(repo), path.strip("/"), anchor
+
+
+class SiteIndex:
+    """
+    Every file compiled into the site, by its path in the site and by the repo and path it was compiled from
+
+    Built once all of the site is staged, so a link is resolved with dict lookups wherever its target ended up
+    """
+
+    def __init__(self, docs_root):
+        self.docs_root = Path(docs_root)
+        # every file and folder of the site, posix and relative to docs_root
+        self.paths = set()
+        # (repo, path in the repo) -> path in the site
+        self.sources = {}
+        # path in the site -> (repo, path in the repo)
+        self.origins = {}
+        # `repo_key` of a repo's upstream -> repo
+        self.repos = {}
+        # repo -> (upstream, ref, tracked paths), for links to files of a repo that aren't in the site
+        self.tracked = {}
+
+    def add(self, repo, path, site_path):
+        """
+        Record that site_path was compiled from path of repo, the first site path a source gets is where links go
+        """
+        self.sources.setdefault((repo, path), site_path)
+        self.origins[site_path] = (repo, path)
+
+    def track(self, repo, upstream, ref, paths):
+        """
+        Point links to files of repo that aren't compiled at upstream, as `patch_external_refs` does
+        """
+        self.tracked[repo] = (upstream.removesuffix(".git"), ref, paths)
+
+    def site_path(self, repo, path):
+        """
+        Where path of repo is in the site, a folder is its README / index page, None if it isn't compiled
+        """
+        if (repo, path) in self.sources:
+            return self.sources[(repo, path)]
+        for name in folder_pages:
+            page = posixpath.join(path, name) if path else name
+            if (repo, page) in self.sources:
+                return self.sources[(repo, page)]
+        return None
+
+    def resolve(self, page, target):
+        """
+        (new target, broken) of a link in page, new target is None when the link is fine as it is
+
+        Links to a repo on GitLab whose file is in the site point at that page instead. Relative links are
+        checked against the site first, then against the repo the page came from, for pages compiled to
+        another folder than the one they have in their repo
+        """
+        folder = posixpath.dirname(page)
+        if "://" in target:
+            upstream = upstream_target(target)
+            if upstream is None or upstream[0] not in self.repos:
+                return None, False
+            key, path, anchor = upstream
+            site_path = self.site_path(self.repos[key], path)
+            if site_path is None:
+                return None, False
+            new = posixpath.relpath(site_path, folder)
+            if anchor and line_anchor_regex.fullmatch(anchor) is None:
+                new += "#" + anchor
+            return new, False
+
+        if target.startswith(("mailto:", "#", "<")) or " " in target:
+            return None, False
+        if re.match(r"^\w|\.", target) is None:
+            return None, False
+        path, sep, anchor = target.partition("#")
+        if posixpath.normpath(posixpath.join(folder, path)) in self.paths:
+            return None, False
+        if page in self.origins:
+            repo, source = self.origins[page]
+            source = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+            site_path = self.site_path(repo, source)
+            if site_path is not None:
+                return posixpath.relpath(site_path, folder) + sep + anchor, False
+            if repo in self.tracked and source in self.tracked[repo][2]:
+                upstream, ref, _ = self.tracked[repo]
+                return f"{upstream}/-/tree/{ref}/{source}" + sep + anchor, False
+        return None, True
+
+
+@traced("index")
+def site_index(docs_root, upstreams, bb_include):
+    """
+    `SiteIndex` of docs_root, upstreams maps `bigbang` and every package to its repo's url
+
+    A package's files are the ones under `packages/<pkg>`, Big Bang's are the ones `bb_include` covers
+    """
+    index = SiteIndex(docs_root)
+    for repo, url in upstreams.items():
+        index.repos[repo_key(url)] = repo
+    root = str(docs_root)
+    for folder, dirs, files in os.walk(root):
+        rel = os.path.relpath(folder, root).replace(os.sep, "/")
+        rel = "" if rel == "." else rel
+        parts = rel.split("/")
+        if rel:
+            index.paths.add(rel)
+        index.paths.update(f"{rel}/{name}" if rel else name for name in dirs)
+        for name in files:
+            site_path = f"{rel}/{name}" if rel else name
+            index.paths.add(site_path)
+            if len(parts) >= 2 and parts[0] == "packages" and parts[1] in upstreams:
+                index.add(parts[1], site_path.split("/", 2)[2], site_path)
+            elif parts[0] != "packages" and included(site_path, bb_include):
+                index.add("bigbang", site_path, site_path)
+    return index
+
+
+@traced("site links")
+def link_pages(index, pages=None):
+    """
+    Resolve the links of pages (paths in the site, default every markdown page) against index, in place
+
+    Returns the links that don't resolve as (page, target) pairs, for `report_broken`
+    """
+    if pages is None:
+        pages = sorted(p for p in index.paths if p.endswith(".md"))
+    broken = []
+    for page in pages:
+        folder = posixpath.dirname(page)
+        if posixpath.basename(page) == "values.md" and (
+            posixpath.join(folder, "values.json") in index.paths
+        ):
+            # rendered from a values table, not written by hand
+            continue
+        path = index.docs_root / page
+        text = path.read_text()
+
+        def patch(target):
+            new, missing = index.resolve(page, target)
+            if missing:
+                broken.append((page, target))
+            return new
+
+        patched = patch_links(text, patch)
+        if patched != text:
+            materialize(path)
+            path.write_text(patched)
+            count(files=1, bytes=len(patched))
+    return broken
+
+
+def report_broken(broken, path=None):
+    """
+    Print the links that don't resolve in one block, and write them to path as json if given
+    """
+    if path is not None:
+        Path(path).write_text(
+            json.dumps([{"page": p, "target": t} for p, t in broken], indent=2)
+        )
+    if len(broken) == 0:
+        return
+    pages = sorted({p for p, _ in broken})
+    print(
+        f"[yellow]WARNING  -[/yellow] {len(broken)} broken link(s) in {len(pages)} page(s), their targets aren't in the site or their repo:"
+    )
+    for page, target in broken:
+        print(f"             '{page}': '{target}'")
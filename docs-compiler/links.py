@@ -0,0 +1,186 @@
+import re
+from bisect import bisect_right
+
+# a line opening or closing a fenced code block: any indentation (fences nest in lists), then 3+ backticks or tildes
+fence_regex = re.compile(r"^[ \t]*(`{3,}|~{3,})(.*)$")
+backticks_regex = re.compile(r"`+")
+# the next bracket / parenthesis decides whether a `<target>` or `(title)` is closed
+angle_regex = re.compile(r"[<>]")
+paren_regex = re.compile(r"[()]")
+# parentheses nest this deep in a target at most, like cmark's limit, so a line of `](](](` can't go quadratic
+max_depth = 32
+# most targets have no whitespace, parentheses, brackets, escapes or title, these skip the parser
+plain_target_regex = re.compile(r"[^\s()<>\\]*\)")
+
+
+def lines(text):
+    """
+    (offset, line) of every line in text, without splitting it into a list first
+    """
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        yield start, text[start:end]
+        start = end + 1
+
+
+def code_spans(line):
+    """
+    (start, end) of the inline code spans of a line, a run of backticks is closed by the next run as long as it
+    """
+    runs = [m.span() for m in backticks_regex.finditer(line)]
+    by_length = {}
+    for n, (start, end) in enumerate(runs):
+        by_length.setdefault(end - start, []).append(n)
+    spans = []
+    n = 0
+    while n < len(runs):
+        same = by_length[runs[n][1] - runs[n][0]]
+        closer = bisect_right(same, n)
+        if closer < len(same):
+            spans.append((runs[n][0], runs[same[closer]][1]))
+            n = same[closer] + 1
+        else:
+            # an unmatched run is plain text
+            n += 1
+    return spans
+
+
+def destination(line, i):
+    """
+    Parse the inline link destination that starts at line[i], right after `](`
+
+    Returns (start, end) of the target and the index after the closing `)`, or None if this isn't a link.
+    Targets can hold balanced parentheses or be wrapped in `<>`, and can be followed by a title. Every search
+    stops at the next character that could start another link, so a line is parsed in linear time
+    """
+    plain = plain_target_regex.match(line, i)
+    if plain is not None:
+        return i, plain.end() - 1, plain.end()
+    n = len(line)
+    while i < n and line[i] in " \t":
+        i += 1
+    if i < n and line[i] == "<":
+        bracket = angle_regex.search(line, i + 1)
+        if bracket is None or bracket.group() == "<":
+            return None
+        start, end = i + 1, bracket.start()
+        after = end + 1
+    else:
+        start, depth, end = i, 0, i
+        while end < n:
+            c = line[end]
+            if c == "\\" and end + 1 < n:
+                end += 2
+                continue
+            if c in " \t":
+                break
+            if c == "(":
+                depth += 1
+                if depth > max_depth:
+                    return None
+            elif c == ")":
+                if depth == 0:
+                    break
+                depth -= 1
+            end += 1
+        if depth != 0:
+            return None
+        after = end
+    while after < n and line[after] in " \t":
+        after += 1
+    if after < n and line[after] in "\"'(":
+        if line[after] == "(":
+            title_end = paren_regex.search(line, after + 1)
+            if title_end is None or title_end.group() == "(":
+                return None
+            title_end = title_end.start()
+        else:
+            title_end = line.find(line[after], after + 1)
+            if title_end == -1:
+                return None
+        after = title_end + 1
+        while after < n and line[after] in " \t":
+            after += 1
+    if after >= n or line[after] != ")":
+        return None
+    return start, end, after + 1
+
+
+def line_links(line):
+    """
+    (start, end, target) of the inline links and images of a line, outside of its code spans
+    """
+    spans = code_spans(line) if "`" in line else []
+    span = 0
+    i = line.find("](")
+    while i != -1:
+        while span < len(spans) and spans[span][1] <= i:
+            span += 1
+        if span < len(spans) and spans[span][0] <= i:
+            i = line.find("](", spans[span][1])
+            continue
+        found = destination(line, i + 2)
+        if found is None:
+            i = line.find("](", i + 2)
+            continue
+        start, end, after = found
+        yield start, end, line[start:end]
+        i = line.find("](", after)
+
+
+def scan_links(text):
+    """
+    (start, end, target) of every inline link / image target in markdown text, in a single pass over its lines
+
+    Links in fenced code (``` or ~~~) are skipped. A fence that is never closed isn't rendered as code,
+    so the links after it are yielded once the end of the text shows it wasn't
+    """
+    fence = None
+    pending = []
+    for offset, line in lines(text):
+        match = fence_regex.match(line) if "``" in line or "~~" in line else None
+        if fence is None:
+            if match is not None and not (
+                match.group(1)[0] == "`" and "`" in match.group(2)
+            ):
+                fence = match.group(1)
+                continue
+            if "](" in line:
+                for start, end, target in line_links(line):
+                    yield offset + start, offset + end, target
+            continue
+        if (
+            match is not None
+            and match.group(1)[0] == fence[0]
+            and len(match.group(1)) >= len(fence)
+            and match.group(2).strip() == ""
+        ):
+            fence = None
+            pending.clear()
+            continue
+        if "](" in line:
+            for start, end, target in line_links(line):
+                pending.append((offset + start, offset + end, target))
+    yield from pending
+
+
+def patch_links(text, patch):
+    """
+    Rewrite link targets in a single pass, `patch(target)` returns the new target or None to leave a link as is
+    """
+    out = []
+    last = 0
+    for start, end, target in scan_links(text):
+        new = patch(target)
+        if new is None or new == target:
+            continue
+        out.append(text[last:start])
+        out.append(new)
+        last = end
+    if last == 0:
+        return text
+    out.append(text[last:])
+    return "".join(out)
@@ -0,0 +1,56 @@
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from io import StringIO
+
+_local = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _console():
+    # rich is only imported once something is printed
+    from rich.console import Console
+
+    return Console()
+
+
+def console():
+    """
+    Console for the current thread, a buffered one while inside `captured()`
+    """
+    return getattr(_local, "console", None) or _console()
+
+
+def print(*objects, **kwargs):
+    console().print(*objects, **kwargs)
+
+
+@contextmanager
+def captured():
+    """
+    Buffer everything printed on this thread, so output from packages compiled in parallel doesn't interleave
+    """
+    from rich.console import Console
+
+    real = _console()
+    buf = StringIO()
+    _local.console = Console(
+        file=buf,
+        force_terminal=real.is_terminal,
+        force_interactive=False,
+        color_system=real.color_system,
+        width=real.width,
+    )
+    try:
+        yield buf
+    finally:
+        del _local.console
+
+
+def flush(buf):
+    """
+    Write a buffer from `captured()` to this thread's console, the real one unless it is captured too
+    """
+    out = console().file
+    out.write(buf.getvalue())
+    out.flush()
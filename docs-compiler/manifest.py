@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import click
+
+from .cache import cache_dir, write_entry
+from .log import print
+
+# where every compiled file of a docs root came from, dot files aren't part of the site
+sources_file = ".sources.json"
+# bumped when the layout of a manifest changes
+manifest_format = 1
+# a file changed this recently could change again within its mtime's resolution, its hash isn't kept
+racy_ns = 2 * 10**9
+
+
+def write_sources(index, refs, docs_root):
+    """
+    Write {path in the site: [repo, ref, path in the repo]} of every file of a `SiteIndex` to docs_root
+
+    refs maps every repo to the ref it was compiled from
+    """
+    sources = {
+        site_path: [repo, refs.get(repo), path]
+        for site_path, (repo, path) in sorted(index.origins.items())
+    }
+    Path(docs_root, sources_file).write_text(json.dumps(sources))
+
+
+def file_entry(data, source=None):
+    """
+    Manifest entry of an output file with content data, source is its path in the docs if it has one
+    """
+    entry = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+    if source is not None:
+        entry["source"] = source.replace(os.sep, "/")
+    return entry
+
+
+def load_hashes():
+    """
+    {path: [mtime_ns, size, sha256]} of the files `copied_entry` hashed in earlier builds
+    """
+    path = cache_dir("manifest") / "hashes.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_hashes(hashes):
+    """
+    Keep hashes for the next build, with the ones other shards saved meanwhile, dropping files that are gone
+    """
+    merged = load_hashes()
+    merged.update(hashes)
+    merged = {path: known for path, known in merged.items() if os.path.exists(path)}
+    write_entry(cache_dir("manifest") / "hashes.json", json.dumps(merged).encode())
+
+
+def copied_entry(path, source, hashes):
+    """
+    `file_entry` of an output file copied as it is from path, which is only read if hashes has no hash
+    for it at its mtime and size
+    """
+    stat = os.stat(path)
+    known = hashes.get(path)
+    if known is None or known[:2] != [stat.st_mtime_ns, stat.st_size]:
+        with open(path, "rb") as f:
+            known = [
+                stat.st_mtime_ns,
+                stat.st_size,
+                hashlib.sha256(f.read()).hexdigest(),
+            ]
+        if time.time_ns() - stat.st_mtime_ns > racy_ns:
+            hashes[path] = known
+    entry = {"sha256": known[2], "size": stat.st_size}
+    if source is not None:
+        entry["source"] = source.replace(os.sep, "/")
+    return entry
+
+
+def write_manifest(path, files, docs_root, ref, version=None):
+    """
+    Write the manifest of a site to path, files maps every output file to its `file_entry`
+
+    Sources are resolved from docs paths to the repo, ref and path a file was compiled from with the
+    `sources_file` of docs_root, files without one (theme assets, the search index, ...) have none
+    """
+    sources = {}
+    sources_path = Path(docs_root, sources_file)
+    if sources_path.exists():
+        sources = json.loads(sources_path.read_text())
+    out = {}
+    for name, entry in sorted(files.items()):
+        entry = dict(entry)
+        if "source" in entry:
+            source = sources.get(entry["source"])
+            if source is None:
+                del entry["source"]
+            else:
+                repo, repo_ref, repo_path = source
+                entry["source"] = {"repo": repo, "ref": repo_ref, "path": repo_path}
+        out[name] = entry
+    manifest = {
+        "format": manifest_format,
+        "ref": ref,
+        "version": version,
+        "files": out,
+    }
+    Path(path).write_text(json.dumps(manifest, indent=1))
+    print(f"INFO     - Manifest of {len(out)} file(s) written to {path}")
+
+
+def version_path(path, version):
+    """
+    Manifest path of one version of a `--tags` batch, `<stem>-<version><suffix>` next to path
+    """
+    path = Path(path)
+    return path.with_name(f"{path.stem}-{version}{path.suffix}")
+
+
+def load_manifest(path):
+    manifest = json.loads(Path(path).read_text())
+    if manifest.get("format") != manifest_format:
+        raise click.ClickException(
+            f"{path} isn't a manifest this compiler writes (format {manifest.get('format')})"
+        )
+    return manifest
+
+
+def delta(old, new):
+    """
+    (added, changed, removed) paths between the files of two manifests, sorted
+    """
+    old, new = old["files"], new["files"]
+    added = sorted(name for name in new if name not in old)
+    removed = sorted(name for name in old if name not in new)
+    changed = sorted(
+        name
+        for name in new
+        if name in old and new[name]["sha256"] != old[name]["sha256"]
+    )
+    return added, changed, removed
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+def manifest():
+    pass
+
+
+@manifest.command()
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.option("--json", "as_json", help="Print the delta as json instead", is_flag=True)
+@click.option(
+    "--prefix-version",
+    help="Prefix paths with the manifests' mike version, where `mike deploy` puts them",
+    is_flag=True,
+)
+def diff(old, new, as_json, prefix_version):
+    """
+    Files added (A), changed (M) and removed (D) from the site of manifest OLD to the one of NEW
+    """
+    old, new = load_manifest(old), load_manifest(new)
+    prefix = ""
+    if prefix_version:
+        if new["version"] is None or old["version"] != new["version"]:
+            raise click.ClickException(
+                "'--prefix-version' needs manifests of the same version of a `--tags` build"
+            )
+        prefix = f"{new['version']}/"
+    added, changed, removed = delta(old, new)
+    if as_json:
+        click.echo(
+            json.dumps(
+                {
+                    "added": [prefix + name for name in added],
+                    "changed": [prefix + name for name in changed],
+                    "removed": [prefix + name for name in removed],
+                },
+                indent=2,
+            )
+        )
+        return
+    for status, names in [("A", added), ("M", changed), ("D", removed)]:
+        for name in names:
+            click.echo(f"{status}\t{prefix}{name}")
+    size = sum(new["files"][name]["size"] for name in added + changed)
+    # stdout is the list of files, for scripts
+    click.echo(
+        f"INFO     - {len(added)} added, {len(changed)} changed, {len(removed)} removed, {size} bytes to upload",
+        err=True,
+    )
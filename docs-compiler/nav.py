@@ -0,0 +1,159 @@
+import os
+from pathlib import Path
+
+from .trace import traced
+
+# the generated nav, dot files aren't part of the site
+nav_file = ".nav.yml"
+# mkdocs config of `./docs`, mkdocs.yml with the nav generated for it
+site_config = ".mkdocs-docs.yml"
+# files mkdocs renders as pages
+page_suffixes = {".markdown", ".md", ".mdown", ".mkd", ".mkdn"}
+
+
+def dirname_to_title(name):
+    """
+    Title of a folder's section when no nav names it, as mkdocs gives it
+    """
+    title = name.replace("-", " ").replace("_", " ")
+    return title.capitalize() if title.lower() == title else title
+
+
+def folder_entries(docs_root, rel):
+    """
+    Pages and subfolders of folder rel in the order mkdocs finds them: index / README first, then pages, then folders by name
+    """
+    pages, folders = [], []
+    with os.scandir(Path(docs_root, rel)) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or (rel == "" and entry.name == "templates"):
+                continue
+            if entry.is_dir():
+                folders.append(entry.name)
+            elif os.path.splitext(entry.name)[1] in page_suffixes:
+                pages.append(entry.name)
+    pages.sort(
+        key=lambda n: (0, "")
+        if os.path.splitext(n)[0] in ("index", "README")
+        else (1, n)
+    )
+    return pages, sorted(folders)
+
+
+def merge_sections(items):
+    """
+    Sections of folders with the same title are one section in mkdocs' default nav
+    """
+    merged, sections = [], {}
+    for item in items:
+        if isinstance(item, dict):
+            ((title, children),) = item.items()
+            if title in sections:
+                sections[title].extend(children)
+                continue
+            sections[title] = list(children)
+            item = {title: sections[title]}
+        merged.append(item)
+    return merged
+
+
+def nav_entry(entry):
+    """
+    (title, value) of an entry of a `pages` nav, the title of a bare name is None
+    """
+    if isinstance(entry, str):
+        return None, str(entry)
+    return next(iter(entry.items()))
+
+
+def folder_nav(docs_root, rel, navs):
+    """
+    Nav of folder rel as mkdocs' `nav` config: the `pages` nav docs-compiler.yaml gives the folder, else mkdocs' default
+
+    A nav lists pages and subfolders of the folder by name, with a title or without, urls with a title, nested
+    sections and `...` for everything it doesn't list. Entries for files a folder doesn't have are left out,
+    and so are folders without any page
+    """
+    pages, folders = folder_entries(docs_root, rel)
+    items = {}
+    for name in pages:
+        items[name] = f"{rel}/{name}" if rel else name
+    for name in folders:
+        children = folder_nav(docs_root, f"{rel}/{name}" if rel else name, navs)
+        if len(children) > 0:
+            items[name] = {dirname_to_title(name): children}
+    if navs.get(rel) is None:
+        return merge_sections(items.values())
+
+    entries = [nav_entry(e) for e in navs[rel]]
+    listed = {value for _, value in entries if isinstance(value, str)}
+
+    def resolve(entries):
+        nav = []
+        for title, value in entries:
+            if isinstance(value, list):
+                children = resolve(nav_entry(e) for e in value)
+                if len(children) > 0:
+                    nav.append({str(title): children})
+            elif value == "...":
+                nav.extend(item for name, item in items.items() if name not in listed)
+            elif value in items:
+                item = items[value]
+                if title is not None:
+                    # a folder's section keeps its pages under the title the nav gives it
+                    content = (
+                        next(iter(item.values())) if isinstance(item, dict) else item
+                    )
+                    item = {str(title): content}
+                nav.append(item)
+            elif title is not None and "://" in value:
+                nav.append({str(title): str(value)})
+        return nav
+
+    return resolve(entries)
+
+
+@traced("nav")
+def site_nav(docs_root, bb_nav, configs):
+    """
+    Nav of the whole site: Big Bang's nav, the packages index and every package by name with its own nav
+    """
+    navs = {
+        "": bb_nav,
+        "packages": [{"Home": "index.md"}] + [{pkg: pkg} for pkg in sorted(configs)],
+    }
+    for pkg, config in configs.items():
+        navs[f"packages/{pkg}"] = config.get("pages", {}).get("nav")
+    return folder_nav(docs_root, "", navs)
+
+
+def write_nav(docs_root, bb_nav, configs):
+    """
+    Resolve the site's nav and write it to docs_root as a config fragment, for `mkdocs_config`
+    """
+    import yaml
+
+    nav = site_nav(docs_root, bb_nav, configs)
+    # libyaml's dumper escapes the emoji of the titles
+    text = yaml.dump({"nav": nav}, Dumper=yaml.SafeDumper, allow_unicode=True)
+    Path(docs_root, nav_file).write_text(text)
+    return nav
+
+
+def mkdocs_config(docs_root, path, site_dir=None):
+    """
+    Write a config at path that is mkdocs.yml with docs_root and the nav generated for it, returns path
+
+    Relative paths in a config resolve against its folder, so path has to sit next to mkdocs.yml. An unchanged
+    config isn't written again, `mkdocs serve` rebuilds the whole site when it is
+    """
+    text = f"INHERIT: mkdocs.yml\ndocs_dir: {docs_root}\n"
+    if site_dir is not None:
+        text += f"site_dir: {site_dir}\n"
+    fragment = Path(docs_root, nav_file)
+    if fragment.exists():
+        text += fragment.read_text()
+    path = Path(path)
+    if path.exists() == False or path.read_text() != text:
+        path.write_text(text)
+    return path
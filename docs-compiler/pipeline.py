@@ -0,0 +1,154 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from .stage import materialize
+from .trace import count, traced
+
+toc_regex = re.compile(r"^\[\[_TOC_\]\]$\n?", re.MULTILINE)
+# same delimiters as python-frontmatter, a page's header is the yaml between its first two `---` lines
+frontmatter_boundary = re.compile(r"^-{3,}\s*$", re.MULTILINE)
+# metadata_key -> dump_yaml, see `dump_yaml_cached`
+dumped = {}
+
+
+@lru_cache(maxsize=None)
+def yaml_codec():
+    """
+    PyYAML's safe loader and dumper, the libyaml (C) ones when PyYAML was built with them
+    """
+    import yaml
+
+    return (
+        getattr(yaml, "CSafeLoader", yaml.SafeLoader),
+        getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+    )
+
+
+def split_frontmatter(text):
+    """
+    (header, content) of a page, header is None when it has no yaml frontmatter
+
+    Only the header is looked at, the content after it isn't scanned for delimiters
+    """
+    if frontmatter_boundary.match(text) is None:
+        return None, text
+    text = text.strip()
+    start = text.index("\n") + 1 if "\n" in text else len(text)
+    end = frontmatter_boundary.search(text, start)
+    if end is None:
+        return None, text
+    return text[start : end.start()], text[end.end() :].strip()
+
+
+def metadata_key(metadata):
+    """
+    Stand-in for metadata that is cheaper to keep and compare than a deep copy
+
+    Safe loaded yaml only holds builtin types, whose repr tells different values apart
+    """
+    return repr(metadata)
+
+
+def load_yaml(header):
+    import yaml
+
+    return yaml.load(header, Loader=yaml_codec()[0])
+
+
+def dump_yaml(metadata):
+    """
+    Metadata as block style yaml with sorted keys, the way python-frontmatter writes it
+    """
+    import yaml
+
+    return yaml.dump(
+        metadata, Dumper=yaml_codec()[1], default_flow_style=False, allow_unicode=True
+    ).strip()
+
+
+def dump_yaml_cached(metadata, key):
+    """
+    `dump_yaml` memoized by `metadata_key`, most pages of a package are given the same tags
+    """
+    # packages compiled in parallel share `dumped`, another thread can clear it between a write and a read
+    text = dumped.get(key)
+    if text is None:
+        text = dump_yaml(metadata)
+        if len(dumped) >= 1024:
+            dumped.clear()
+        dumped[key] = text
+    return text
+
+
+class Document:
+    """
+    A markdown page held in memory, its frontmatter is parsed once into `metadata` and the rest is `content`
+    """
+
+    def __init__(self, path, text):
+        self.path = Path(path)
+        self.header, self.content = split_frontmatter(text)
+        self.metadata = {}
+        if self.header is not None:
+            metadata = load_yaml(self.header)
+            if isinstance(metadata, dict):
+                self.metadata = metadata
+        # what the header parsed to, a header whose metadata didn't change is written back as is
+        self.loaded = metadata_key(self.metadata)
+
+    @classmethod
+    @traced("read")
+    def load(cls, src, dst=None):
+        with open(src) as f:
+            return cls(dst or src, f.read())
+
+    def dumps(self):
+        if len(self.metadata) == 0:
+            return self.content
+        key = metadata_key(self.metadata)
+        if self.header is not None and key == self.loaded:
+            header = self.header.strip()
+        else:
+            header = dump_yaml_cached(self.metadata, key)
+        return f"---\n{header}\n---\n\n{self.content.strip()}".strip()
+
+    @traced("write")
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = self.dumps()
+        materialize(self.path)
+        with open(self.path, "w") as f:
+            f.write(data)
+            f.close()
+        count(files=1, bytes=len(data))
+
+
+class Pipeline:
+    """
+    Ordered list of transforms run over documents in memory
+
+    A transform is any callable taking a `Document`, it edits `content` / `metadata` in place.
+    Every document is read once, goes through all of the transforms, then is written once
+    """
+
+    def __init__(self, transforms=None):
+        self.transforms = list(transforms or [])
+
+    def add(self, transform):
+        self.transforms.append(transform)
+        return self
+
+    def run(self, docs):
+        for doc in docs:
+            for transform in self.transforms:
+                transform(doc)
+            doc.write()
+
+
+@traced("toc")
+def remove_gitlab_toc(doc):
+    """
+    Drop GitLab's `[[_TOC_]]` lines, mkdocs renders its own toc
+    """
+    doc.content = toc_regex.sub("", doc.content)
@@ -1,39 +1,134 @@
+import hashlib
 import os
 import shutil
 import subprocess as sp
+import time
 from pathlib import Path
 
-from rich.console import Console
-from ruamel.yaml import YAML
-
-c = Console()
+from .cache import cache_dir, touch_entry, write_entry
+from .log import console, print
+from .nav import site_config
+from .stage import materialize, stage_tree
+from .trace import count, span, traced
 
 
 def cleanup():
     shutil.rmtree("docs", ignore_errors=True, onerror=None)
+    Path(site_config).unlink(missing_ok=True)
+
 
+@traced("preflight")
+def preflight(bb, docs_root="docs"):
+    from ruamel.yaml import YAML
 
-def preflight(bb):
-    with c.status("Running preflight steps...", spinner="aesthetic"):
-        shutil.rmtree("docs", ignore_errors=True, onerror=None)
-        shutil.copytree("base", "docs", dirs_exist_ok=True)
+    with console().status("Running preflight steps...", spinner="aesthetic"):
+        shutil.rmtree(docs_root, ignore_errors=True, onerror=None)
+        stage_tree("base", docs_root)
         with Path().cwd().joinpath("docs-compiler.yaml").open("r") as f:
             meta = YAML().load(f)
         for folder in meta.keys():
             if folder != "/":
-                os.makedirs(Path().cwd() / "docs" / folder, exist_ok=True)
+                os.makedirs(Path().cwd() / docs_root / folder, exist_ok=True)
 
 
-def postflight():
-    with c.status("Running postflight steps...", spinner="aesthetic"):
-        sp.run(
-            ["./scripts/remove-gitlab-toc.sh"],
-            cwd=Path().cwd(),
-            capture_output=True,
-            encoding="utf-8",
-        )
-        sp.run(
-            ["./scripts/prettier.sh"],
-            cwd=Path().cwd(),
-            encoding="utf-8",
+# files prettier formats, everything else in docs is copied as is
+prettier_suffixes = {".css", ".html", ".js", ".json", ".md", ".scss", ".yaml", ".yml"}
+# files per prettier call, keeps the command line under the OS limit
+prettier_batch = 500
+# what changes how prettier formats a file, besides the file itself
+prettier_setup = [
+    "scripts/prettier.sh",
+    ".prettierignore",
+    ".prettierrc",
+    ".prettierrc.json",
+    ".prettierrc.yaml",
+    ".prettierrc.yml",
+    ".prettierrc.toml",
+    ".prettierrc.js",
+    ".prettierrc.cjs",
+    "prettier.config.js",
+    "prettier.config.cjs",
+    ".editorconfig",
+    "package.json",
+]
+
+
+def prettier_version():
+    """
+    Version of the prettier on PATH, "" if there is none
+    """
+    try:
+        res = sp.run(["prettier", "--version"], capture_output=True, encoding="utf-8")
+    except OSError:
+        return ""
+    count(subprocess=1)
+    return res.stdout.strip() if res.returncode == 0 else ""
+
+
+@traced("postflight")
+def postflight(docs_root="docs"):
+    """
+    Run prettier over the files in docs_root that haven't been formatted before
+
+    Formatted output is kept in `.cache/prettier` under a hash of the unformatted file (and of prettier's version
+    and config), files seen before are written from there and only new content goes through prettier, in batches
+    """
+    start = time.time()
+    with console().status("Running postflight steps...", spinner="aesthetic"):
+        setup = hashlib.sha256(prettier_version().encode() + b"\0")
+        for f in prettier_setup:
+            if Path(f).exists():
+                setup.update(f.encode() + b"\0" + Path(f).read_bytes() + b"\0")
+        cache = cache_dir("prettier")
+
+        pending = []
+        cached = 0
+        for folder, dirs, files in os.walk(docs_root):
+            # prettier skips dot files when given a folder, and the generated ones (`.nav.yml`, ...) aren't pages
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                path = Path(folder) / name
+                if name.startswith(".") or path.suffix not in prettier_suffixes:
+                    continue
+                data = path.read_bytes()
+                # the parser and .prettierignore go by file name
+                digest = setup.copy()
+                digest.update(name.encode() + b"\0" + data)
+                entry = cache / digest.hexdigest()
+                if entry.exists():
+                    output = entry.read_bytes()
+                    if output != data:
+                        materialize(path)
+                        path.write_bytes(output)
+                        count(files=1, bytes=len(output))
+                    touch_entry(entry)
+                    cached += 1
+                else:
+                    pending.append((path, entry))
+
+        formatted = 0
+        for i in range(0, len(pending), prettier_batch):
+            batch = pending[i : i + prettier_batch]
+            # prettier writes in place
+            for path, _ in batch:
+                materialize(path)
+            with span("prettier", files=len(batch)):
+                count(subprocess=1)
+                res = sp.run(
+                    ["./scripts/prettier.sh", *[str(path) for path, _ in batch]],
+                    cwd=Path().cwd(),
+                    encoding="utf-8",
+                )
+            if res.returncode != 0:
+                continue
+            formatted += len(batch)
+            for path, entry in batch:
+                write_entry(entry, path.read_bytes())
+
+    if formatted < len(pending):
+        print(
+            "[yellow]WARNING  -[/yellow] prettier failed, the files it didn't format were not cached"
         )
+    print(
+        f"INFO     - Postflight took {(time.time() - start).__round__(2)} seconds: {formatted} file(s) formatted, {cached} from cache"
+    )
@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .cache import cache_dir, touch_entry, write_entry
+from .log import print
+from .stage import materialize, stage_file
+from .trace import count, span, traced
+
+# text nginx would otherwise compress on every request, `gzip_static` serves `<file>.gz` instead. Pages aren't,
+# Padawan fills in their nonce with `sub_filter`, which can't edit a compressed response
+gzip_suffixes = {".css", ".js", ".json"}
+# what Padawan replaces with each response's CSP nonce
+nonce_placeholder = b"PADAWAN_CSP_NONCE"
+# files that point at assets by relative path
+reference_suffixes = {".css", ".html"}
+# `<stem>.<8 hex>[.min].<suffix>`, material names its own assets the same way, custom-csp.conf caches both for good
+fingerprinted_regex = re.compile(r"\.[0-9a-f]{8}(\.min)?\.\w+$")
+# characters around a reference in an attribute, a css `url()` or a srcset
+reference_delimiters = set(" \t\n\r\f\v\"'()<>=,")
+
+
+def fingerprint(path, assets, record=None):
+    """
+    Stage a copy of path named after its content, next to it
+    """
+    folder, name = os.path.split(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()[:8]
+    stem, suffix = os.path.splitext(name)
+    fingerprinted = f"{stem}.{digest}{suffix}"
+    if os.path.exists(os.path.join(folder, fingerprinted)) == False:
+        stage_file(path, os.path.join(folder, fingerprinted))
+    assets[os.path.normpath(path)] = fingerprinted
+    if record is not None:
+        record(os.path.join(folder, fingerprinted), data, path)
+
+
+def fingerprint_assets(site_dir, record=None):
+    """
+    Give every file under `static` a copy named after its content, returns {asset: fingerprinted name}
+
+    Stylesheets are pointed at the copies of the fonts and images they use before they are fingerprinted
+    themselves, so their names change when those do. The copies are staged next to the originals, which stay
+    for whatever refers to them in a way that isn't rewritten (scripts, absolute urls). `static/cas` is content
+    addressed already
+    """
+    static = Path(site_dir) / "static"
+    paths = []
+    for folder, dirs, files in os.walk(static):
+        if Path(folder) == static:
+            dirs[:] = [d for d in dirs if d != "cas"]
+        for name in files:
+            if name.endswith(".gz") or fingerprinted_regex.search(name):
+                continue
+            paths.append(os.path.join(folder, name))
+
+    assets = {}
+    for path in paths:
+        if os.path.splitext(path)[1] not in reference_suffixes:
+            fingerprint(path, assets, record)
+    regex = references_regex(assets)
+    for path in paths:
+        if os.path.splitext(path)[1] in reference_suffixes:
+            if regex is not None:
+                rewrite_file(path, assets, regex, record=record)
+            fingerprint(path, assets, record)
+    return assets
+
+
+def references_regex(assets):
+    """
+    Matches the name of any of the assets where a reference can end, None without assets
+    """
+    names = sorted({os.path.basename(a) for a in assets}, key=len, reverse=True)
+    if len(names) == 0:
+        return None
+    d = re.escape("".join(sorted(reference_delimiters)))
+    return re.compile(
+        f"(?<=[/{d}])({'|'.join(re.escape(n) for n in names)})(?=[?#{d}])"
+    )
+
+
+def rewrite_references(text, folder, assets, regex):
+    """
+    Point the references of a file in folder at the fingerprinted copies of the assets they resolve to
+    """
+
+    def sub(m):
+        # the folders of a reference are walked back to its start, a regex matching them would be tried at
+        # every delimiter of the page
+        start = m.start()
+        while start > 0 and text[start - 1] not in reference_delimiters:
+            start -= 1
+        asset = os.path.normpath(os.path.join(folder, text[start : m.end()]))
+        if asset in assets:
+            return assets[asset]
+        return m.group(0)
+
+    return regex.sub(sub, text)
+
+
+def rewrite_file(path, assets, regex, data=None, record=None):
+    """
+    `rewrite_references` of the file at path, written back if it changed, returns its content
+    """
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    text = data.decode("utf-8", errors="surrogateescape")
+    rewritten = rewrite_references(text, os.path.dirname(path), assets, regex)
+    if rewritten == text:
+        return data
+    data = rewritten.encode("utf-8", errors="surrogateescape")
+    # fingerprinted copies can share the file's data
+    materialize(path)
+    with open(path, "wb") as f:
+        f.write(data)
+    count(files=1, bytes=len(data))
+    if record is not None:
+        record(path, data)
+    return data
+
+
+def publish_file(path, cache, assets, regex, record=None):
+    """
+    Rewrite the asset references of one file and stage its `.gz`, returns (compressed, from cache, bytes saved)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    suffix = os.path.splitext(path)[1]
+    if regex is not None and suffix in reference_suffixes:
+        data = rewrite_file(path, assets, regex, data, record)
+    if suffix not in gzip_suffixes or nonce_placeholder in data:
+        return 0, 0, 0
+
+    entry = cache / hashlib.sha256(data).hexdigest()
+    hit = entry.exists()
+    if hit:
+        touch_entry(entry)
+    else:
+        # no name or time in the header, the same page always compresses to the same bytes
+        write_entry(entry, gzip.compress(data, compresslevel=9, mtime=0))
+    size = entry.stat().st_size
+    if size >= len(data):
+        # nginx sends the smaller of the two anyway
+        return 1 - hit, hit, 0
+    stage_file(entry, f"{path}.gz")
+    if record is not None:
+        record(f"{path}.gz", entry.read_bytes(), path)
+    return 1 - hit, hit, len(data) - size
+
+
+@traced("precompress")
+def precompress(site_dir, jobs=None, files=None):
+    """
+    Fingerprint the assets of a built site and write `.gz` siblings of its scripts, styles and json, for nginx
+    (see custom-csp.conf)
+
+    Compressed files are kept in `.cache/gzip` under a hash of their content, so only files that changed since
+    the last build are compressed again. Files are handled on `jobs` threads, zlib and hashing release the GIL
+
+    The `manifest` entries in files are updated for what is rewritten or added if given, a copy has the source
+    of the file it was made from
+    """
+    start = time.time()
+    site_dir = Path(site_dir)
+    record = None
+    if files is not None:
+        from .manifest import file_entry
+
+        def site_path(path):
+            return os.path.relpath(path, site_dir).replace(os.sep, "/")
+
+        def record(path, data, original=None):
+            source = files.get(site_path(original or path), {}).get("source")
+            files[site_path(path)] = file_entry(data, source)
+
+    with span("fingerprint"):
+        assets = fingerprint_assets(site_dir, record)
+    regex = references_regex(assets)
+    cache = cache_dir("gzip")
+
+    paths = []
+    for folder, _, names in os.walk(site_dir):
+        for name in names:
+            suffix = os.path.splitext(name)[1]
+            if suffix in gzip_suffixes or suffix in reference_suffixes:
+                paths.append(os.path.join(folder, name))
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        results = list(
+            pool.map(lambda p: publish_file(p, cache, assets, regex, record), paths)
+        )
+
+    compressed = sum(r[0] for r in results)
+    cached = sum(r[1] for r in results)
+    saved = sum(r[2] for r in results)
+    print(
+        f"INFO     - Precompressed {compressed + cached} file(s), {cached} from cache, {saved} bytes saved, and fingerprinted {len(assets)} asset(s) in {(time.time() - start).__round__(2)} seconds"
+    )
+    return assets
@@ -1,52 +1,402 @@
+import hashlib
+import json
+import os
+import posixpath
 import re
-import shutil
 import subprocess as sp
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 
-import frontmatter
-import semver
-from git import Repo
-from rich import print
-from rich.console import Console
-from ruamel.yaml import YAML
+from .cache import cache_dir
+from .links import patch_links, scan_links
+from .log import console, print
+from .stage import stage_file, stage_tree
+from .trace import count, span, traced
 
-c = Console()
+sha_regex = re.compile(r"[0-9a-f]{7,40}")
+# GitPython handles open at once, each one can keep `git cat-file` helpers running, `BB_DOCS_GIT_HANDLES`
+max_handles = int(os.environ.get("BB_DOCS_GIT_HANDLES", 8))
+# git commands running at once across threads, `BB_DOCS_GIT_PROCESSES`
+max_processes = int(os.environ.get("BB_DOCS_GIT_PROCESSES", 8))
+# seconds Big Bang's tags are trusted after a fetch to pick the latest version, `BB_DOCS_TAGS_MAX_AGE`,
+# 0 (the default) fetches them on every build
+tags_max_age = int(os.environ.get("BB_DOCS_TAGS_MAX_AGE", 0))
+
+
+class GitStats:
+    """
+    git processes started since the last `reset`, by command, and the most that ran at once
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_processes)
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spawned = {}
+            self.helpers = 0
+            self.running = 0
+            self.peak = 0
+
+    @contextmanager
+    def process(self, cmd, helper=False):
+        """
+        Count a git process, and hold one of `max_processes` slots while it runs, helpers run on their own
+        """
+        with self.lock:
+            self.spawned[cmd] = self.spawned.get(cmd, 0) + 1
+            self.helpers += helper
+        count(git=1)
+        if helper:
+            yield
+            return
+        with self.slots:
+            with self.lock:
+                self.running += 1
+                self.peak = max(self.peak, self.running)
+            try:
+                yield
+            finally:
+                with self.lock:
+                    self.running -= 1
+
+
+git_stats = GitStats()
+
+
+@lru_cache(maxsize=None)
+def traced_repo_class():
+    """
+    GitPython's `Repo`, with every git process it starts traced and counted in `git_stats`
+    """
+    from git import Git, Repo
+
+    class TracedGit(Git):
+        def execute(self, command, *args, **kwargs):
+            cmd = next((c for c in command[1:] if not c.startswith("-")), "")
+            # `as_process` returns while git runs, for GitPython's long lived `cat-file` helpers
+            helper = kwargs.get("as_process", False)
+            with span("git", cmd=cmd), git_stats.process(cmd, helper):
+                return super().execute(command, *args, **kwargs)
+
+    class TracedRepo(Repo):
+        GitCommandWrapperType = TracedGit
+
+    return TracedRepo
+
+
+class RepoPool:
+    """
+    GitPython `Repo`s by path, at most `size` open at once
+
+    Opening another one closes the least recently used handle no thread is using, which stops its helper
+    processes. A handle is opened again, without any process, the next time it is needed
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.handles = OrderedDict()
+        self.users = {}
+        self.cond = threading.Condition()
+        self.opened = 0
+        self.evicted = 0
+        self.peak = 0
+
+    @contextmanager
+    def handle(self, path):
+        """
+        The `Repo` of path for the length of a `with` block, waits for a handle to be free if all of them are in use
+        """
+        with self.cond:
+            while path not in self.handles and len(self.handles) >= self.size:
+                idle = next((p for p in self.handles if self.users[p] == 0), None)
+                if idle is None:
+                    self.cond.wait()
+                    continue
+                self._close(idle)
+                self.evicted += 1
+            if path not in self.handles:
+                self.handles[path] = traced_repo_class()(path)
+                self.users[path] = 0
+                self.opened += 1
+                self.peak = max(self.peak, len(self.handles))
+            self.handles.move_to_end(path)
+            self.users[path] += 1
+            repo = self.handles[path]
+        try:
+            yield repo
+        finally:
+            with self.cond:
+                self.users[path] -= 1
+                self.cond.notify_all()
+
+    def _close(self, path):
+        self.handles.pop(path).close()
+        del self.users[path]
+
+    def close(self, path=None):
+        """
+        Close the handle of path, default every handle, that no thread is using
+        """
+        with self.cond:
+            for p in [path] if path is not None else list(self.handles):
+                if p in self.handles and self.users[p] == 0:
+                    self._close(p)
+            self.cond.notify_all()
+
+
+repo_pool = RepoPool(max_handles)
+
+
+def git_summary():
+    """
+    One line of `git_stats` and `repo_pool`, for the end of a build
+    """
+    with git_stats.lock:
+        spawned = dict(git_stats.spawned)
+        helpers, peak = git_stats.helpers, git_stats.peak
+    top = sorted(spawned.items(), key=lambda c: (-c[1], c[0]))[:5]
+    return (
+        f"INFO     - git: {sum(spawned.values())} process(es) ({', '.join(f'{c} {n}' for c, n in top)}),"
+        f" {helpers} helper(s), at most {peak} at once, {repo_pool.peak} of {repo_pool.size} repo handle(s)"
+        f" open at most, {repo_pool.evicted} closed to stay under it"
+    )
+
+
+class MissingRefError(Exception):
+    """
+    A repo or ref that isn't available locally, and couldn't (or wasn't allowed to) be fetched
+    """
 
 
 class SubmoduleRepo:
-    def __init__(self, name, upstream):
+    def __init__(self, name, upstream, sparse=None, offline=False):
+        """
+        `sparse` limits the repo to a list of paths: it is cloned without blobs, and only those paths are checked out
+
+        `offline` never touches the network, refs that aren't already local raise a `MissingRefError`
+        """
         self.name = name
         self.path = Path.cwd() / "submodules" / name
         self.upstream = upstream
+        self.sparse = sparse
+        self.offline = offline
         if self.path.exists() == False:
+            if offline:
+                raise MissingRefError(f"'{name}' is not cloned to 'submodules/{name}'")
             self.clone_to_submodules()
-        self.repo = Repo(self.path)
-        self.fetch()
+        self.set_sparse_checkout()
         self.ref = "main"
+        self._refs = None
+        self._revision_dates = None
+        self._tracked_paths = None
+
+    def handle(self):
+        """
+        The repo's GitPython `Repo` from `repo_pool`, for the length of a `with` block
+        """
+        return repo_pool.handle(self.path)
+
+    def close(self):
+        """
+        Close the repo's handle and stop its helper processes, it is opened again when needed
+        """
+        repo_pool.close(self.path)
 
-    def fetch(self):
-        self.repo.remotes.origin.fetch()
+    def git(self, *args, **kwargs):
+        """
+        Run a git command in the repo, as `Repo.git.<command>` with the command as first argument
+        """
+        with self.handle() as repo:
+            return getattr(repo.git, args[0])(*args[1:], **kwargs)
+
+    def fetch_tags(self):
+        if not self.offline:
+            self.git("fetch", "origin", "--tags")
+
+    def fetch_ref(self, ref):
+        """
+        Fetch only ref from origin, as a tag, a branch or a commit sha
+        """
+        if sha_regex.fullmatch(ref):
+            refspecs = [ref]
+        else:
+            refspecs = [
+                f"+refs/tags/{ref}:refs/tags/{ref}",
+                f"+refs/heads/{ref}:refs/remotes/origin/{ref}",
+            ]
+        from git import GitCommandError
+
+        for refspec in refspecs:
+            try:
+                self.git("fetch", "origin", "--no-tags", refspec)
+                return
+            except GitCommandError:
+                continue
 
     def clone_to_submodules(self):
-        with c.status(f"Cloning {self.name}...", spinner="aesthetic"):
+        args = ["git", "clone", self.upstream, f"submodules/{self.name}"]
+        if self.sparse is not None:
+            # blobs are fetched on checkout, and only for the paths that get checked out
+            args += ["--filter=blob:none", "--sparse"]
+        with console().status(f"Cloning {self.name}...", spinner="aesthetic"), span(
+            "clone", repo=self.name
+        ), git_stats.process("clone"):
             sp.run(
-                ["git", "clone", self.upstream, f"submodules/{self.name}"],
+                args,
                 capture_output=True,
                 cwd=Path().cwd(),
             )
 
+    def set_sparse_checkout(self):
+        """
+        Limit the worktree to `self.sparse`, or bring back the full worktree if an earlier build was sparse
+        """
+        if self.sparse is not None:
+            patterns = [f"/{p}" for p in self.sparse]
+            self.git("sparse_checkout", "set", "--no-cone", *patterns)
+        elif self.git("config", "core.sparseCheckout", with_exceptions=False) == "true":
+            self.git("sparse_checkout", "disable")
+
+    def rev_parse(self, rev):
+        """
+        Commit sha for rev if it is in the local object store, otherwise None
+        """
+        sha = self.git(
+            "rev_parse",
+            "--verify",
+            "--quiet",
+            f"{rev}^{{commit}}",
+            with_exceptions=False,
+        )
+        return sha or None
+
+    def head(self):
+        """
+        Commit sha of HEAD, read from the repo's refs instead of starting a process
+
+        `Repo.head.commit` starts a `git cat-file` helper that outlives the call, `rev-parse` a process per call
+        """
+        from git.refs.symbolic import SymbolicReference
+
+        with self.handle() as repo:
+            return SymbolicReference.dereference_recursive(repo, "HEAD")
+
+    def is_dirty(self):
+        """
+        Whether tracked files have changes, staged or not, with one `git status` instead of GitPython's two diffs
+        """
+        return self.git("status", "--porcelain", "--untracked-files=no") != ""
+
+    def resolve(self, ref):
+        """
+        Commit sha that ref points to, without checking it out
+
+        Tags and commits never move, so once they are local they are not fetched again,
+        and what they resolved to is kept in `.cache/refs/<repo>.json`. Branches are fetched every time unless offline
+        """
+        refs_file = cache_dir("refs") / f"{self.name}.json"
+        if self._refs is None:
+            self._refs = json.loads(refs_file.read_text()) if refs_file.exists() else {}
+
+        sha = self._refs.get(ref)
+        if sha is not None and self.rev_parse(sha) is not None:
+            return sha
+
+        sha = self.rev_parse(f"refs/tags/{ref}")
+        if sha is None and sha_regex.fullmatch(ref):
+            sha = self.rev_parse(ref)
+        if sha is None and not self.offline:
+            self.fetch_ref(ref)
+            sha = self.rev_parse(f"refs/tags/{ref}")
+            if sha is None and sha_regex.fullmatch(ref):
+                sha = self.rev_parse(ref)
+        if sha is not None:
+            self._refs[ref] = sha
+            refs_file.write_text(json.dumps(self._refs, indent=2))
+            return sha
+
+        # a branch, as of the last fetch
+        sha = self.rev_parse(f"refs/remotes/origin/{ref}")
+        if sha is None:
+            raise MissingRefError(f"'{self.name}' has no tag, branch or commit '{ref}'")
+        return sha
+
+    @traced("checkout")
     def checkout(self, ref):
-        if self.repo.is_dirty():
+        if self.is_dirty():
             print(f"{self.name} repo has pending changes, please commit or stash them")
             return
-        self.repo.git.checkout(ref)
+        self.git("checkout", self.resolve(ref))
         # print(f"{self.name} checked out @{ref}")
         self.ref = ref
 
-    def get_revision_date(self, abspath):
-        return self.repo.git.log(abspath, n=1, date="short", format="%ad by %cn")
+    def get_revision_date(self, path):
+        return self.revision_dates().get(Path(path).as_posix(), "")
+
+    @traced("history")
+    def revision_dates(self):
+        """
+        Map every path in the history of HEAD to the "<date> by <committer>" of the last commit that touched it
+
+        This is one walk over the history instead of a `git log -n1` per file,
+        and the result is saved per commit so rebuilding the same ref doesn't walk it again
+        """
+        sha = self.head()
+        if self._revision_dates is not None and self._revision_dates[0] == sha:
+            return self._revision_dates[1]
+
+        cached = cache_dir("revision-dates", self.name) / f"{sha}.json"
+        if cached.exists():
+            dates = json.loads(cached.read_text())
+        else:
+            dates = {}
+            log = self.git(
+                "log",
+                sha,
+                "--no-renames",
+                "--name-only",
+                "-z",
+                date="short",
+                format="%x01%ad by %cn",
+            )
+            # each commit is "\x01<date> by <committer>\0\n<path>\0<path>\0...", newest first
+            for commit in log.split("\x01")[1:]:
+                revision_date, _, paths = commit.partition("\0")
+                for path in paths.lstrip("\n").split("\0"):
+                    if path != "" and path not in dates:
+                        dates[path] = revision_date
+            tmp = cached.with_suffix(".tmp")
+            tmp.write_text(json.dumps(dates))
+            tmp.replace(cached)
 
+        self._revision_dates = (sha, dates)
+        return dates
+
+    @traced("copy")
     def copy_files(self, src_root, dst_root, include):
+        """
+        Stage everything in `include` from src_root to dst_root, except markdown, see `stage.stage_file`
+
+        Markdown files are returned as (src, dst) pairs for the document pipeline, which writes them itself
+        """
+        markdown = []
+
+        def skip_markdown(folder, names):
+            skipped = [
+                n for n in names if n.endswith(".md") and Path(folder, n).is_file()
+            ]
+            for n in skipped:
+                src = Path(folder, n)
+                markdown.append((src, dst_root / src.relative_to(src_root)))
+            return skipped
+
         for p in include:
             src = Path(src_root / p)
             if src.exists() == False:
@@ -56,132 +406,133 @@ class SubmoduleRepo:
                 continue
             dst = dst_root / p
             if src.is_dir():
-                shutil.copytree(src, dst, dirs_exist_ok=True)
+                stage_tree(src, dst, ignore=skip_markdown)
+            elif src.suffix == ".md":
+                markdown.append((src, dst))
             else:
-                shutil.copy2(src, dst)
+                stage_file(src, dst)
+        return markdown
 
-    def patch_external_refs(self, md_files_glob, root: Path):
+    def tracked_paths(self):
+        """
+        Every file and folder tracked at HEAD, relative to the repo root
+        """
+        sha = self.head()
+        if self._tracked_paths is not None and self._tracked_paths[0] == sha:
+            return self._tracked_paths[1]
+
+        paths = set()
+        for path in self.git("ls_tree", sha, "-r", "--name-only", "-z").split("\0"):
+            while path != "" and path not in paths:
+                paths.add(path)
+                path = posixpath.dirname(path)
+
+        self._tracked_paths = (sha, paths)
+        return paths
+
+    @traced("links")
+    def patch_external_refs(self, doc, root: Path, index):
         """
         This method checks for links to external files (ie, files not found within the `include` block of the config)
-        It then patches the files to reference the upstream file (found in Repo1) instead of a relative link
-        """
-        # these look for local and relative links only
-        # markdown regex to extract links from [Link label](link url)
-        md_regex = r"\]\(([^\)]*)\)"
-        md_glob = re.compile(md_regex)
-        all_md = root.glob(md_files_glob)
-        for md in all_md:
-            relative_path = Path(md).resolve().expanduser().relative_to(root)
-            if (
-                Path(md).name == "values.md"
-                and "values" in frontmatter.loads(Path(md).read_text())["tags"]
-                or md == "about.md"
-            ):
-                # dont check the values.md files or about.md
+        It then patches the document to reference the upstream file (found in Repo1) instead of a relative link
+
+        `index` holds every path in the output tree (see `utils.tree_index`), including documents that are staged
+        but not written yet, so checking a link is a set lookup instead of hitting the filesystem
+        """
+        md = doc.path
+        if md.name == "values.md" and "values" in doc.metadata["tags"]:
+            # dont check the values.md files
+            return
+        relative_path = md.relative_to(root)
+        folder = str(md.parent)
+
+        def exists(p):
+            return os.path.normpath(os.path.join(folder, p)) in index
+
+        paths_to_check = set()
+        # links in fenced and inline code are not checked
+        for _, _, url in scan_links(doc.content):
+            if url.startswith("mailto:"):
+                # not gonna check email links yet
                 continue
-            with Path(md).open() as f:
-                original = f.read()
-            without_code = re.sub(
-                r"^```[^\S\r\n]*[a-z]*(?:\n(?!```$).*)*\n```",
-                "",
-                original,
-                0,
-                re.MULTILINE,
-            )
-            folder = Path(md).resolve().expanduser().parent
-            md_urls = md_glob.findall(without_code)
+            if url.startswith("#"):
+                # not gonna check header links yet
+                continue
+            if url.startswith("<"):
+                # not gonna check alt href pattern
+                continue
+            if url.startswith("https") or url.startswith("http"):
+                # not gonna check remote
+                continue
+            if " " in url:
+                # url contains spaces, prob a bad url anyways
+                continue
+            # remove title link
+            if re.match(r"^\w|\.", url):
+                paths_to_check.add(url.rsplit("#", 1)[0])
 
-            paths_to_check = []
-            for url in md_urls:
-                if url.startswith("mailto:"):
-                    # not gonna check email links yet
-                    continue
-                if url.startswith("#"):
-                    # not gonna check header links yet
-                    continue
-                if url.startswith("<"):
-                    # not gonna check alt href pattern
-                    continue
-                if url.startswith("https") or url.startswith("http"):
-                    # not gonna check remote
-                    continue
-                if " " in url:
-                    # url contains spaces, prob a bad url anyways
-                    continue
-                # remove title link
-                if re.match(r"^\w|\.", url):
-                    paths_to_check.append(url.rsplit("#", 1)[0])
-
-            paths_to_check: list[str] = list(set(paths_to_check))
-            for p in paths_to_check:
-                full_path = folder.joinpath(p).resolve()
-                if not full_path.exists():
-                    # if the path does not exist, but there is a path that matches without the current folder in the path,
-                    # replace it with that one
-                    if p.startswith(f"./{Path(p).parent.name}") or p.startswith(
-                        Path(p).parent.name
-                    ):
-                        without_parent = (
-                            p.removeprefix(Path(p).parent.name)
-                            .removeprefix(f"./{Path(p).parent.name}")
-                            .removeprefix("/")
-                        )
-                        without_parent_path_exists = folder.joinpath(
-                            without_parent
-                        ).exists()
-
-                        if without_parent_path_exists:
-                            print(
-                                f"INFO     - Patching broken relative link to './docs' in '{self.name}/{str(Path(md).relative_to(root))}': '{p}' --> {without_parent}"
-                            )
-                            with Path(md).open() as f:
-                                old_content = f.read()
-                            with Path(md).open("w") as f:
-                                patched_content = re.sub(p, without_parent, old_content)
-                                f.write(patched_content)
-                                f.close()
-                            continue
-
-                    relative_to_repo_root = (
-                        self.path.joinpath(relative_path)
-                        .parent.joinpath(Path(p))
-                        .resolve()
-                        .relative_to(self.path)
-                    )
-                    file_actually_exists = self.path.joinpath(
-                        relative_to_repo_root
-                    ).exists()
-                    if file_actually_exists == False:
-                        print(
-                            f"[yellow]WARNING  -[/yellow] Unable to patch broken relative link in '{self.name}/{str(Path(md).relative_to(root))}', file does not exist: '{p}'"
-                        )
-                        continue
-                    upstream_path = (
-                        self.upstream.removesuffix(".git")
-                        + "/-/tree/"
-                        + self.ref
-                        + "/"
-                        + str(relative_to_repo_root)
-                    )
+        patches = {}
+        for p in paths_to_check:
+            if exists(p):
+                continue
+            # if the path does not exist, but there is a path that matches without the current folder in the path,
+            # replace it with that one
+            parent = Path(p).parent.name
+            if p.startswith(f"./{parent}") or p.startswith(parent):
+                without_parent = (
+                    p.removeprefix(parent).removeprefix(f"./{parent}").removeprefix("/")
+                )
+                if exists(without_parent):
                     print(
-                        f"INFO     - Patching broken relative link in '{self.name}/{str(Path(md).relative_to(root))}': '{p}' --> {upstream_path}"
+                        f"INFO     - Patching broken relative link to './docs' in '{self.name}/{relative_path}': '{p}' --> {without_parent}"
                     )
-                    with Path(md).open() as f:
-                        old_content = f.read()
-                    with Path(md).open("w") as f:
-                        patched_content = re.sub(p, upstream_path, old_content)
-                        f.write(patched_content)
-                        f.close()
+                    patches[p] = without_parent
+                    continue
+
+            relative_to_repo_root = posixpath.normpath(
+                posixpath.join(relative_path.parent.as_posix(), p)
+            )
+            if relative_to_repo_root not in self.tracked_paths():
+                # left for `linkgraph.link_pages`, which reports it if nothing else in the site resolves it
+                continue
+            upstream_path = (
+                self.upstream.removesuffix(".git")
+                + "/-/tree/"
+                + self.ref
+                + "/"
+                + relative_to_repo_root
+            )
+            print(
+                f"INFO     - Patching broken relative link in '{self.name}/{relative_path}': '{p}' --> {upstream_path}"
+            )
+            patches[p] = upstream_path
+
+        def patch(url):
+            p = url.rsplit("#", 1)[0]
+            if p in patches:
+                return patches[p] + url[len(p) :]
+
+        if len(patches) > 0:
+            doc.content = patch_links(doc.content, patch)
 
 
 class BigBangRepo(SubmoduleRepo):
-    def __init__(self):
+    def __init__(self, sparse=None, offline=False):
+        if sparse is not None:
+            # needed by get_pkgs
+            sparse = [*sparse, "chart/values.yaml"]
         SubmoduleRepo.__init__(
-            self, "bigbang", "https://repo1.dso.mil/platform-one/big-bang/bigbang.git"
+            self,
+            "bigbang",
+            "https://repo1.dso.mil/platform-one/big-bang/bigbang.git",
+            sparse,
+            offline,
         )
         self.ref = "master"
 
     def get_pkgs(self):
+        from ruamel.yaml import YAML
+
         pkgs = {}
         values_path = self.path / "chart" / "values.yaml"
         with open(values_path) as values_yaml:
@@ -208,22 +559,84 @@ class BigBangRepo(SubmoduleRepo):
 
         return pkgs
 
+    def refresh_tags(self):
+        """
+        Fetch the repo's tags, unless offline or `tags_max_age` is set and they were fetched less than that ago
+
+        When they were fetched is the mtime of `.cache/refs/<repo>.tags`
+        """
+        if self.offline:
+            print(f"INFO     - Offline, using the tags already in '{self.name}'")
+            return
+        fetched = cache_dir("refs") / f"{self.name}.tags"
+        if tags_max_age > 0 and fetched.exists() and len(self.get_tags()) > 0:
+            age = time.time() - fetched.stat().st_mtime
+            if age < tags_max_age:
+                print(
+                    f"INFO     - Using the tags of '{self.name}' fetched {int(age // 60)} minute(s) ago, `BB_DOCS_TAGS_MAX_AGE` is {tags_max_age}s"
+                )
+                return
+        self.fetch_tags()
+        fetched.touch()
+
+    def tags_state(self):
+        """
+        Fingerprint of the repo's tags, changes whenever a tag is added, moved or deleted
+        """
+        with self.handle() as repo:
+            git_dir = Path(repo.common_dir)
+        state = []
+        packed = git_dir / "packed-refs"
+        if packed.exists():
+            stat = packed.stat()
+            state.append(("packed-refs", stat.st_mtime_ns, stat.st_size))
+        for folder, _, files in os.walk(git_dir / "refs" / "tags"):
+            for f in files:
+                stat = Path(folder, f).stat()
+                state.append((os.path.join(folder, f), stat.st_mtime_ns, stat.st_size))
+        return hashlib.sha256(json.dumps(sorted(state)).encode()).hexdigest()
+
     def get_tags(self):
+        """
+        Release tags, newest commit first
+
+        The tags and their commit dates come from a single `git for-each-ref`,
+        and the result is kept in `.cache/tags` until the tags change
+        """
+        import semver
+
+        state = self.tags_state()
+        cached = cache_dir("tags") / f"{self.name}.json"
+        if cached.exists():
+            data = json.loads(cached.read_text())
+            if data["state"] == state:
+                return data["tags"]
+
+        tags = []
+        listing = self.git(
+            "for_each_ref",
+            "refs/tags",
+            format="%(*committerdate:unix) %(committerdate:unix) %(refname:strip=2)",
+        )
+        for line in listing.splitlines():
+            # annotated tags have the date of the commit they point to in the first field, lightweight ones the second
+            annotated_date, date, name = line.split(" ", 2)
+            tags.append((int(annotated_date or date), name))
+
         versions = []
-        for tag in reversed(
-            sorted(self.repo.tags, key=lambda t: t.commit.committed_datetime)
-        ):
-            if "rc" in tag.name:
+        for _, name in reversed(sorted(tags, key=lambda t: t[0])):
+            if "rc" in name:
                 # skip rc versions
                 continue
-            elif tag.name == "":
+            elif name == "":
                 # skip blank version(s)
                 continue
 
             try:
-                semver.VersionInfo.parse(tag.name)
-                versions.append(tag.name)
+                semver.VersionInfo.parse(name)
+                versions.append(name)
             except ValueError:
                 continue
 
+        cached.write_text(json.dumps({"state": state, "tags": versions}))
         return versions
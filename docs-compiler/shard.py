@@ -0,0 +1,349 @@
+import json
+import logging
+import os
+import shutil
+import subprocess as sp
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mkdocs.plugins import BasePlugin
+from mkdocs.structure.files import Files
+
+from .manifest import copied_entry, file_entry, load_hashes, save_hashes
+from .trace import count, span
+
+# pages of other shards are rendered with this empty template, mkdocs doesn't write empty output
+skip_template = "bb-docs-shard-skip.html"
+search_index = os.path.join("search", "search_index.json")
+# builds one shard in a fresh interpreter, the result is the last line it prints
+shard_probe = """
+import importlib, json, sys
+shard = importlib.import_module(sys.argv[1])
+print(json.dumps(shard.build_shard(**json.loads(sys.argv[2]))))
+"""
+
+
+def section(src_path):
+    """
+    Section of the docs a file belongs to, `packages/<pkg>` for the docs of a package and "" for everything else
+    """
+    parts = Path(src_path).parts
+    if len(parts) > 2 and parts[0] == "packages":
+        return f"packages/{parts[1]}"
+    return ""
+
+
+def plan(docs_root, shards):
+    """
+    Split the sections of docs_root into at most `shards` groups with about as much markdown each
+    """
+    weights = {"": 0}
+    for folder, _, names in os.walk(docs_root):
+        for name in names:
+            if name.endswith(".md"):
+                path = os.path.join(folder, name)
+                s = section(os.path.relpath(path, docs_root))
+                weights[s] = weights.get(s, 0) + os.path.getsize(path)
+    groups = [[] for _ in range(min(shards, len(weights)))]
+    loads = [0] * len(groups)
+    for s, weight in sorted(weights.items(), key=lambda sw: (-sw[1], sw[0])):
+        n = loads.index(min(loads))
+        groups[n].append(s)
+        loads[n] += weight
+    return groups
+
+
+class ShardFiles(Files):
+    """
+    Every file of the site, for the nav and links, but only the static files of the shard are copied
+    """
+
+    def __init__(self, files, owns):
+        super().__init__(list(files))
+        self.owns = owns
+
+    def copy_static_files(self, dirty=False):
+        for file in self:
+            if not file.is_documentation_page() and self.owns(file):
+                file.copy_file(dirty)
+
+
+class ShardPlugin(BasePlugin):
+    """
+    Renders the pages and static files of some sections of the docs only
+
+    Every page is still read and goes through `on_page_markdown`, so the nav, titles, links and tags are the
+    ones of the whole site. The `root` shard also renders the theme's files, `404.html` and the sitemap
+    """
+
+    def __init__(self, sections, root):
+        self.sections = set(sections)
+        self.root = root
+        # urls of every page in build order, and of the ones this shard rendered
+        self.pages, self.owned = [], []
+
+    def owns(self, file):
+        docs_dir = os.path.join(self.docs_dir, "")
+        if not file.abs_src_path.startswith(docs_dir):
+            # theme and plugin files
+            return self.root
+        return section(file.src_path) in self.sections
+
+    def on_config(self, config):
+        self.docs_dir = os.path.abspath(config["docs_dir"])
+        if not self.root:
+            config["theme"].static_templates.clear()
+            config["extra_templates"] = []
+        return config
+
+    def on_files(self, files, config):
+        return ShardFiles(files, self.owns)
+
+    def on_pre_page(self, page, config, files):
+        if not self.owns(page.file):
+            # a markdown instance per page is most of what rendering a page costs, skip it for other shards' pages
+            page.render = lambda config, files: setattr(page, "content", "")
+        return page
+
+    def on_page_markdown(self, markdown, page, config, files):
+        if self.owns(page.file):
+            self.owned.append(page.url)
+            return markdown
+        # keeps the title and metadata it was read with, for the nav of the pages that are rendered
+        page.meta["template"] = skip_template
+        return ""
+
+    def on_env(self, env, config, files):
+        from jinja2 import ChoiceLoader, DictLoader
+
+        # the order pages are built in, once plugins are done with the files and nav
+        self.pages = [f.page.url for f in files.documentation_pages()]
+        env.loader = ChoiceLoader([DictLoader({skip_template: ""}), env.loader])
+        return env
+
+
+class ManifestPlugin(BasePlugin):
+    """
+    Records every file the build writes for `manifest`, with its content hash and the docs file it came from
+
+    Pages are hashed from their output as they are rendered, the files mkdocs copies from their source with
+    `copied_entry`, so only new or changed ones are read, and what other plugins write (the search index,
+    the sitemap) once the build is done
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def on_config(self, config):
+        self.site_dir = config["site_dir"]
+        return config
+
+    def on_files(self, files, config):
+        self.sources = {f.dest_path: f.src_path for f in files}
+        self.copied = {
+            f.dest_path: f.abs_src_path for f in files if not f.is_documentation_page()
+        }
+        return files
+
+    def on_post_page(self, output, page, config):
+        # as mkdocs writes it, empty pages aren't
+        if output.strip():
+            data = output.encode("utf-8", errors="xmlcharrefreplace")
+            self.files[page.file.dest_path.replace(os.sep, "/")] = file_entry(
+                data, page.file.src_path
+            )
+        return output
+
+    def on_post_build(self, config):
+        hashes = load_hashes()
+        for folder, _, names in os.walk(self.site_dir):
+            for name in names:
+                path = os.path.join(folder, name)
+                dest = os.path.relpath(path, self.site_dir)
+                if dest.replace(os.sep, "/") in self.files:
+                    continue
+                if dest in self.copied:
+                    self.files[dest.replace(os.sep, "/")] = copied_entry(
+                        self.copied[dest], self.sources.get(dest), hashes
+                    )
+                    continue
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.files[dest.replace(os.sep, "/")] = file_entry(
+                    data, self.sources.get(dest)
+                )
+        save_hashes(hashes)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(f"{record.levelname:<8} -  {record.getMessage()}")
+
+
+def build_shard(config_file, site_dir, sections, root, manifest=False):
+    """
+    `mkdocs build` the sections of one shard to site_dir, in a process of its own
+
+    Returns the warnings logged, the error that stopped the build if any, the page urls of `ShardPlugin` and
+    the files of `ManifestPlugin` with `manifest`
+    """
+    from mkdocs.commands.build import build
+    from mkdocs.config import load_config
+
+    records = Records()
+    logger = logging.getLogger("mkdocs")
+    logger.addHandler(records)
+    logger.propagate = False
+    plugin = ShardPlugin(sections, root)
+    recorder = ManifestPlugin()
+    error = None
+    try:
+        config = load_config(config_file, site_dir=site_dir)
+        config["plugins"]["bb-docs-shard"] = plugin
+        if manifest:
+            # last, so it sees pages as the other plugins leave them
+            config["plugins"]["bb-docs-manifest"] = recorder
+        build(config)
+    except (Exception, SystemExit) as e:
+        error = f"ERROR    -  {type(e).__name__}: {e}"
+    return {
+        "warnings": records.lines,
+        "error": error,
+        "pages": plugin.pages,
+        "owned": plugin.owned,
+        "files": recorder.files,
+    }
+
+
+def run_shard(config_file, site_dir, sections, env, manifest=False):
+    """
+    `build_shard` in a new interpreter, so shards render in parallel whatever started the build
+    """
+    kwargs = {
+        "config_file": str(config_file),
+        "site_dir": str(site_dir),
+        "sections": sections,
+        "root": "" in sections,
+        "manifest": manifest,
+    }
+    path = [str(Path(__file__).resolve().parent.parent), os.environ.get("PYTHONPATH")]
+    out = sp.run(
+        [sys.executable, "-c", shard_probe, __name__, json.dumps(kwargs)],
+        capture_output=True,
+        text=True,
+        env={
+            **os.environ,
+            **env,
+            "PYTHONPATH": os.pathsep.join(p for p in path if p),
+        },
+    )
+    if out.returncode != 0 or out.stdout.strip() == "":
+        return {
+            "warnings": [],
+            "error": f"ERROR    -  Shard exited with {out.returncode}\n{out.stderr}",
+            "pages": [],
+            "owned": [],
+            "files": {},
+        }
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def merge_search(parts, results):
+    """
+    One search index from the shards', with the entries of every page in the order a serial build adds them
+    """
+    by_url, config = {}, None
+    for part, result in zip(parts, results):
+        path = part / search_index
+        if not path.exists():
+            continue
+        data = json.loads(path.read_text())
+        config = data["config"]
+        owned = set(result["owned"])
+        for entry in data["docs"]:
+            url = entry["location"].split("#")[0]
+            if url in owned:
+                by_url.setdefault(url, []).append(entry)
+    if config is None:
+        return None
+    docs = [entry for url in results[0]["pages"] for entry in by_url.get(url, [])]
+    # as mkdocs' search plugin dumps it
+    return json.dumps(
+        {"docs": docs, "config": config}, sort_keys=True, separators=(",", ":")
+    )
+
+
+def merge(parts, site_dir, results, files=None):
+    """
+    Move the files of every shard into site_dir, which ends up as a serial build would have left it
+
+    Adds the files of every shard to files if given, with the search index as it is merged
+    """
+    if len(parts) == 1:
+        # the one shard rendered the whole site, search index and all
+        shutil.rmtree(site_dir, ignore_errors=True)
+        os.replace(parts[0], site_dir)
+        if files is not None:
+            files.update(results[0]["files"])
+        return
+    index = merge_search(parts, results)
+    if files is not None:
+        for result in results:
+            files.update(result["files"])
+        files.pop(search_index.replace(os.sep, "/"), None)
+        if index is not None:
+            files[search_index.replace(os.sep, "/")] = file_entry(index.encode())
+    shutil.rmtree(site_dir, ignore_errors=True)
+    for part in parts:
+        for folder, _, names in os.walk(part):
+            rel = os.path.relpath(folder, part)
+            os.makedirs(site_dir / rel, exist_ok=True)
+            for name in names:
+                if os.path.normpath(os.path.join(rel, name)) != search_index:
+                    os.replace(os.path.join(folder, name), site_dir / rel / name)
+        shutil.rmtree(part)
+    if index is not None:
+        (site_dir / search_index).parent.mkdir(parents=True, exist_ok=True)
+        (site_dir / search_index).write_text(index)
+
+
+def render_sharded(config_file, docs_root, site_dir, shards, env=None, files=None):
+    """
+    `mkdocs build` in `shards` processes, each one rendering some packages of docs_root, merged into site_dir
+
+    Returns a `CompletedProcess` as `sp.run` would for `mkdocs build`, with what mkdocs logged in stderr. files
+    gets the `file_entry` of every file of the site if given, hashed by the shards as they write them
+    """
+    groups = plan(docs_root, shards)
+    site_dir = Path(site_dir).resolve()
+    parts = [
+        site_dir.with_name(f".{site_dir.name}-shard-{n}") for n in range(len(groups))
+    ]
+    args = ["mkdocs", "build", "--config-file", str(config_file)]
+    with span("mkdocs", shards=len(groups)):
+        count(subprocess=len(groups))
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            futures = [
+                pool.submit(
+                    run_shard, config_file, part, group, env or {}, files is not None
+                )
+                for part, group in zip(parts, groups)
+            ]
+            results = [future.result() for future in futures]
+
+        # warnings from reading the whole site show up in every shard
+        lines = [line for result in results for line in result["warnings"]]
+        lines = list(dict.fromkeys(lines))
+        errors = [result["error"] for result in results if result["error"]]
+        if len(errors) > 0:
+            for part in parts:
+                shutil.rmtree(part, ignore_errors=True)
+            return sp.CompletedProcess(args, 1, "", "\n".join(lines + errors))
+        with span("merge"):
+            merge(parts, site_dir, results, files)
+    return sp.CompletedProcess(args, 0, "", "\n".join(lines))
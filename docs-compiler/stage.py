@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import shutil
+from pathlib import Path
+
+from .links import patch_links
+from .log import print
+from .trace import count, traced
+
+# ioctl that clones a file's extents (btrfs, xfs, ...), from linux/fs.h
+FICLONE = 0x40049409
+# static files worth storing once, whatever package they come from
+asset_suffixes = {".gif", ".jpeg", ".jpg", ".pdf", ".png", ".svg", ".webp"}
+# files an asset could be referenced from
+text_suffixes = {".css", ".html", ".js", ".json", ".md", ".yaml", ".yml"}
+# (src device, dst device) pairs reflinks failed between, not worth trying again
+no_reflink = set()
+
+
+def reflink(src, dst):
+    """
+    Copy-on-write clone of src at dst, raises OSError where the filesystem (or OS) can't
+    """
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def stage_file(src, dst):
+    """
+    Put src at dst without copying its data: a reflink, else a hardlink, else (across filesystems) a real copy
+
+    Hardlinked files share their data with src, anything that edits a staged file in place has to `materialize` it first.
+    `BB_DOCS_STAGE=copy` always copies
+    """
+    if os.environ.get("BB_DOCS_STAGE") != "copy":
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        devices = (os.stat(src).st_dev, os.stat(os.path.dirname(dst) or ".").st_dev)
+        if devices not in no_reflink:
+            try:
+                reflink(src, dst)
+                count(files=1, reflinks=1)
+                return dst
+            except (OSError, ImportError):
+                no_reflink.add(devices)
+        try:
+            os.link(src, dst)
+            count(files=1, links=1)
+            return dst
+        except OSError:
+            pass
+    count(files=1, bytes=os.path.getsize(src))
+    return shutil.copy2(src, dst)
+
+
+def stage_tree(src, dst, **kwargs):
+    """
+    `shutil.copytree` with `stage_file`
+    """
+    return shutil.copytree(
+        src, dst, dirs_exist_ok=True, copy_function=stage_file, **kwargs
+    )
+
+
+def materialize(path):
+    """
+    Give a hardlinked file its own copy of its data, so writing to it leaves the other names alone
+    """
+    path = Path(path)
+    if path.exists() == False or path.stat().st_nlink < 2:
+        return
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    shutil.copy2(path, tmp)
+    tmp.replace(path)
+    count(files=1, bytes=path.stat().st_size)
+
+
+@traced("dedupe")
+def dedupe_assets(docs_root):
+    """
+    Store identical static assets once, in `static/cas/<hash><suffix>`, and point markdown links at that copy
+
+    An asset that is still mentioned somewhere after the links are rewritten (raw html, css, ...) is left where it is,
+    and so is everything in `static`, which mkdocs.yml refers to
+    """
+    docs_root = Path(docs_root)
+    store = docs_root / "static" / "cas"
+
+    by_digest = {}
+    texts = []
+    for folder, dirs, files in os.walk(docs_root):
+        # the theme's own assets are referenced from mkdocs.yml, leave them be
+        themed = Path(folder).is_relative_to(store.parent)
+        for name in files:
+            path = Path(folder) / name
+            if path.suffix.lower() in asset_suffixes and themed == False:
+                digest = hashlib.sha256(path.read_bytes()).hexdigest()
+                by_digest.setdefault(digest, []).append(path)
+            elif path.suffix in text_suffixes:
+                texts.append(path)
+
+    # duplicate asset -> its copy in the store
+    stored = {}
+    for digest, paths in by_digest.items():
+        if len(paths) > 1:
+            for path in paths:
+                stored[os.path.normpath(path)] = store / f"{digest[:16]}{path.suffix}"
+    if len(stored) == 0:
+        return
+
+    rewritten = set()
+    for path in texts:
+        if path.suffix != ".md":
+            continue
+        content = path.read_text()
+        folder = path.parent
+
+        def patch(target):
+            # keeps the #page=N of a pdf
+            p = target.split("#")[0]
+            asset = os.path.normpath(os.path.join(folder, p))
+            if asset in stored:
+                rewritten.add(asset)
+                return os.path.relpath(stored[asset], folder) + target[len(p) :]
+
+        patched = patch_links(content, patch)
+        if patched != content:
+            materialize(path)
+            path.write_text(patched)
+
+    # file names that show up in any text file once its links are rewritten
+    names = {Path(asset).name for asset in rewritten}
+    mentioned = set()
+    if len(names) > 0:
+        name_regex = re.compile("|".join(re.escape(n) for n in sorted(names)))
+        for path in texts:
+            mentioned.update(name_regex.findall(path.read_text(errors="replace")))
+
+    store.mkdir(parents=True, exist_ok=True)
+    removed, saved = 0, 0
+    for asset in sorted(rewritten):
+        target = stored[asset]
+        if target.exists() == False:
+            shutil.copy2(asset, target)
+        if Path(asset).name in mentioned:
+            continue
+        saved += os.path.getsize(asset)
+        os.unlink(asset)
+        removed += 1
+    print(
+        f"INFO     - Deduplicated {removed} asset(s) into '{store.relative_to(docs_root)}', {saved} bytes saved"
+    )
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from .log import console
+
+_lock = threading.Lock()
+_local = threading.local()
+# (category, name) -> [seconds, calls, {counter: value}]
+_totals = {}
+# Chrome trace events, only kept while `record()` is on
+_events = None
+_origin = time.perf_counter()
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name, cat="stage", **args):
+    """
+    Add the time spent in this block to `name`, along with whatever `count()` is called with inside of it
+
+    `cat` groups spans in the summary, `args` are shown on the span's event in the trace
+    """
+    counters = {}
+    stack = _stack()
+    stack.append(counters)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        with _lock:
+            total = _totals.setdefault((cat, name), [0.0, 0, {}])
+            total[0] += end - start
+            total[1] += 1
+            for k, v in counters.items():
+                total[2][k] = total[2].get(k, 0) + v
+            if _events is not None:
+                _events.append(
+                    {
+                        "name": name,
+                        "cat": cat,
+                        "ph": "X",
+                        "ts": (start - _origin) * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                        "args": {**args, **counters},
+                    }
+                )
+
+
+def traced(name):
+    """
+    Decorator version of `span`
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(**counters):
+    """
+    Add to counters (files, bytes, git processes, ...) of every span open on this thread
+    """
+    for open_span in _stack():
+        for k, v in counters.items():
+            open_span[k] = open_span.get(k, 0) + v
+
+
+def totals(cat="stage"):
+    """
+    Seconds spent per span name since the last `reset()`, time spent by parallel workers adds up
+    """
+    with _lock:
+        return {name: t[0] for (c, name), t in _totals.items() if c == cat}
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def record():
+    """
+    Start keeping every span as a Chrome trace event, see `write_trace`
+    """
+    global _events
+    with _lock:
+        _events = []
+
+
+def write_trace(path):
+    """
+    Write the recorded spans in Chrome trace format, for chrome://tracing or https://ui.perfetto.dev
+    """
+    with _lock:
+        events = list(_events or [])
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def summary():
+    """
+    Print a table per span category: time, calls and counters of each span name, slowest first
+    """
+    from rich.table import Table
+
+    with _lock:
+        rows = {k: (t[0], t[1], dict(t[2])) for k, t in _totals.items()}
+    for cat in sorted({c for c, _ in rows}):
+        spans = sorted(
+            [(name, *row) for (c, name), row in rows.items() if c == cat],
+            key=lambda r: -r[1],
+        )
+        counters = sorted({k for *_, c in spans for k in c})
+        table = Table(title=f"Time per {cat}", title_justify="left")
+        table.add_column(cat.title())
+        table.add_column("Seconds", justify="right")
+        table.add_column("Calls", justify="right")
+        for k in counters:
+            table.add_column(k.title(), justify="right")
+        for name, seconds, calls, c in spans:
+            table.add_row(
+                name,
+                f"{seconds:.3f}",
+                str(calls),
+                *[str(c.get(k, "")) for k in counters],
+            )
+        console().print(table)
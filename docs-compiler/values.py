@@ -0,0 +1,136 @@
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib import resources
+
+from .log import print
+from .trace import traced
+
+# table cells are split on pipes that helm-docs didn't escape
+cell_regex = re.compile(r"(?<!\\)\|")
+alignment_regex = re.compile(r"^:?-+:?$")
+
+
+@dataclass
+class Value:
+    """
+    One row of a helm-docs values table, with helm-docs' escaping undone
+    """
+
+    key: str
+    type: str
+    default: str
+    description: str
+    # helm-docs wraps literal defaults in backticks, ones from a `@default` comment are prose
+    literal: bool = True
+
+    @property
+    def language(self):
+        if self.literal == False or self.type in ("list", "object"):
+            return "text"
+        return "yaml"
+
+    @property
+    def pretty(self):
+        """
+        Default value spread over multiple lines, or None if it fits on one
+        """
+        if self.literal == False:
+            return None
+        if self.type in ("list", "object"):
+            try:
+                value = json.loads(self.default)
+            except ValueError:
+                return None
+            return "\n".join(json.dumps(value, indent=2).split(r"\n"))
+        if r"\n" in self.default:
+            return "\n".join(self.default.split(r"\n"))
+        return None
+
+
+@lru_cache(maxsize=None)
+def values_template():
+    """
+    `templates/values.j2`, read from the package rather than the working directory and compiled on first use
+    """
+    from jinja2 import Template
+
+    return Template(
+        (resources.files(__package__) / "templates" / "values.j2").read_text()
+    )
+
+
+def parse_values_table_from_helm_docs(readme, regex):
+    with open(readme, "r") as f:
+        content = f.read()
+        values_tables = re.findall(regex, content, re.DOTALL)
+        if len(values_tables) == 0:
+            print(f"[yellow]WARNING  -[/yellow] No values table found in {readme}")
+            return None
+        table = values_tables[0]
+        return table
+
+
+@traced("values")
+def parse_values(table):
+    """
+    Values from a helm-docs markdown table, in a single pass over its rows
+    """
+    values = []
+    for row in (table or "").splitlines():
+        row = row.strip()
+        if row.startswith("|") == False:
+            continue
+        cells = [c.strip() for c in cell_regex.split(row)][1:]
+        if cells[-1] == "":
+            cells.pop()
+        if len(cells) < 4 or cells[0] == "Key" or alignment_regex.match(cells[0]):
+            continue
+        cells = [c.replace(r"\|", "|") for c in cells]
+        # a default with pipes that weren't escaped spans several cells
+        default = "|".join(cells[2:-1])
+        literal = len(default) > 1 and default.startswith("`") and default.endswith("`")
+        values.append(
+            Value(
+                key=cells[0],
+                type=cells[1],
+                default=default.strip("`") if literal else default,
+                description=cells[-1],
+                literal=literal,
+            )
+        )
+    return values
+
+
+def patch_values_table_from_helm_docs(doc, table):
+    """
+    Swap the helm-docs values table in a README for a link to its values.md
+    """
+    if table is None:
+        return
+    doc.content = doc.content.replace(
+        table, "\n\nPlease see the [values](values.md) docs.\n\n"
+    )
+
+
+@traced("values")
+def render_values_md(values, title):
+    values_rendered = values_template().render(values=values, title=title)
+    return re.sub("\n\n\n", "\n", values_rendered)
+
+
+@traced("values")
+def dumps_values_json(values):
+    """
+    Compact `values.json` index, key -> type / default / description, for tools that look up keys without parsing markdown
+    """
+    index = {}
+    for value in values:
+        index[value.key] = {
+            "type": value.type,
+            "default": value.default,
+            "description": value.description,
+            "literal": value.literal,
+        }
+    return json.dumps(index, separators=(",", ":"))
@@ -0,0 +1,320 @@
+import os
+import shutil
+import time
+import traceback
+from pathlib import Path
+
+from .cli import (
+    acquire_repos,
+    bb_nav,
+    bb_transforms,
+    bb_values,
+    compile,
+    compile_pkg,
+    link_site,
+    load_config,
+    package_configs,
+    pkg_transforms,
+    pkg_values,
+)
+from .linkgraph import included, report_broken
+from .log import print
+from .nav import mkdocs_config, write_nav
+from .pipeline import Document, Pipeline, remove_gitlab_toc
+from .prenpost import preflight
+from .stage import stage_file
+from .trace import span
+from .utils import tree_index
+
+bb_root = Path("submodules/bigbang")
+# Big Bang sources that are more than a page
+bb_values_source = "docs/understanding-bigbang/configuration/base-config.md"
+bb_packages_source = "docs/packages.md"
+bb_pkgs_source = "chart/values.yaml"
+
+
+def snapshot(paths):
+    """
+    (mtime, size) of every file in or under paths
+    """
+    files = {}
+
+    def add(f):
+        try:
+            st = os.stat(f)
+        except FileNotFoundError:
+            return
+        files[f] = (st.st_mtime_ns, st.st_size)
+
+    for p in paths:
+        if os.path.isdir(p):
+            for folder, dirs, names in os.walk(p):
+                dirs[:] = [d for d in dirs if d != ".git"]
+                for n in names:
+                    add(os.path.join(folder, n))
+        else:
+            add(str(p))
+    return files
+
+
+def count_pages(root):
+    return sum(1 for p in tree_index(root) if p.endswith(".md"))
+
+
+class Watch:
+    """
+    Recompiles what a change to a source file affects, for `--dev`
+
+    Source files are mapped back to their outputs with the `include` rules of `docs-compiler.yaml`. Changed pages
+    go through the transforms again, a changed README re-renders the package's values, and a changed
+    `chart/values.yaml` re-resolves the packages whose tag or repo changed. A changed `docs-compiler.yaml`
+    recompiles everything. The links of the pages written are resolved against the whole site, and the nav
+    again after every rebuild, `config_file` is rewritten if it changed
+    """
+
+    def __init__(
+        self,
+        bb,
+        tag,
+        jobs=1,
+        use_cache=True,
+        sparse=False,
+        fetch_jobs=4,
+        offline=False,
+        repos=None,
+        docs_root="docs",
+        config_file=None,
+    ):
+        self.bb = bb
+        self.tag = tag
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.sparse = sparse
+        self.fetch_jobs = fetch_jobs
+        self.offline = offline
+        self.repos = {} if repos is None else repos
+        self.docs_root = Path(docs_root)
+        self.config_file = config_file
+        # pages written by the rebuild going on
+        self.written = []
+        self.load()
+
+    def load(self):
+        self.meta = load_config()
+        self.pkgs = self.bb.get_pkgs()
+        self.configs = package_configs(self.meta, self.pkgs)
+        missing = {p: self.pkgs[p] for p in self.pkgs if p not in self.repos}
+        if len(missing) > 0:
+            repos, _ = acquire_repos(
+                missing, self.configs, self.fetch_jobs, self.sparse, self.offline
+            )
+            self.repos.update(repos)
+        self.seen = snapshot(self.sources())
+
+    def sources(self):
+        """
+        Files and folders whose changes show up in docs_root
+        """
+        paths = [Path("docs-compiler.yaml"), Path("base")]
+        paths += [bb_root / p for p in self.meta["/"]["include"]]
+        paths += [bb_root / bb_pkgs_source, bb_root / bb_values_source]
+        paths += [bb_root / bb_packages_source]
+        for config in self.configs.values():
+            src_root = Path(config["source"])
+            paths += [src_root / p for p in config["include"]]
+            paths.append(src_root / "README.md")
+        return list(dict.fromkeys(paths))
+
+    def run(self, interval=0.5):
+        """
+        Poll the sources every `interval` seconds until interrupted
+        """
+        print(
+            f"INFO     - Watching {len(self.seen)} source files for changes, press Ctrl+C to stop"
+        )
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            return
+
+    def poll(self):
+        """
+        Rebuild whatever changed since the last poll, returns the number of changed files
+        """
+        now = snapshot(self.sources())
+        changed = {f for f, stat in now.items() if self.seen.get(f) != stat}
+        changed |= {f for f in self.seen if f not in now}
+        self.seen = now
+        if len(changed) == 0:
+            return 0
+        start = time.time()
+        try:
+            with span("watch"):
+                self.written = []
+                pages = self.rebuild(sorted(changed))
+                self.link()
+                self.write_nav()
+        except (Exception, SystemExit) as e:
+            print(
+                f"[red]ERROR[/red]    - Failed to rebuild after a change: {e}\n{traceback.format_exc()}"
+            )
+            return len(changed)
+        print(
+            f"INFO     - Rebuilt {pages} page(s) for {len(changed)} changed file(s) in {(time.time() - start).__round__(3)} seconds"
+        )
+        return len(changed)
+
+    def link(self):
+        if len(self.written) == 0:
+            return
+        pages = [p.relative_to(self.docs_root).as_posix() for p in self.written]
+        report_broken(link_site(self.bb, self.pkgs, self.meta, self.docs_root, pages))
+
+    def write_nav(self):
+        write_nav(self.docs_root, bb_nav(self.meta, self.docs_root), self.configs)
+        if self.config_file is not None:
+            mkdocs_config(self.docs_root, self.config_file)
+
+    def rebuild(self, changed):
+        """
+        Recompile the outputs of the changed files, returns the number of pages written
+        """
+        base, bb_pages, pkg_pages = set(), set(), {}
+        repackage = False
+        for f in map(Path, changed):
+            if f == Path("docs-compiler.yaml"):
+                return self.recompile()
+            if f.is_relative_to("base"):
+                base.add(f.relative_to("base").as_posix())
+            if f.is_relative_to(bb_root):
+                rel = f.relative_to(bb_root).as_posix()
+                repackage |= rel == bb_pkgs_source
+                if included(rel, self.meta["/"]["include"]) or rel in (
+                    bb_values_source,
+                    bb_packages_source,
+                ):
+                    bb_pages.add(rel)
+            for pkg, config in self.configs.items():
+                src_root = Path(config["source"])
+                if f.is_relative_to(src_root):
+                    pkg_pages.setdefault(pkg, set()).add(
+                        f.relative_to(src_root).as_posix()
+                    )
+
+        pages = 0
+        if repackage:
+            pages += self.repackage()
+        if len(base) > 0 or len(bb_pages) > 0:
+            pages += self.rebuild_bb(base, bb_pages)
+        for pkg, rels in pkg_pages.items():
+            if pkg in self.configs:
+                pages += self.rebuild_pkg(pkg, rels)
+        return pages
+
+    def stage(self, src_root, dst_root, rels):
+        """
+        Stage changed files that aren't markdown and remove deleted ones, returns the markdown as (src, dst) pairs
+        """
+        markdown = []
+        for rel in rels:
+            src, dst = src_root / rel, dst_root / rel
+            if src.exists() == False:
+                dst.unlink(missing_ok=True)
+            elif src.suffix == ".md":
+                markdown.append((src, dst))
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                stage_file(src, dst)
+        return markdown
+
+    def rebuild_bb(self, base, rels):
+        docs = []
+        for src, dst in self.stage(Path("base"), self.docs_root, base):
+            stage_file(src, dst)
+            if dst == self.docs_root / "about.md":
+                docs.append(Document.load(dst))
+        include = self.meta["/"]["include"]
+        for src, dst in self.stage(
+            bb_root, self.docs_root, [r for r in rels if included(r, include)]
+        ):
+            docs.append(Document.load(src, dst))
+        if bb_values_source in rels:
+            docs.append(bb_values(self.docs_root))
+        if bb_packages_source in rels:
+            index_doc = Document.load(
+                bb_root / bb_packages_source, self.docs_root / "packages" / "index.md"
+            )
+            Pipeline([remove_gitlab_toc]).run([index_doc])
+            self.written.append(index_doc.path)
+
+        # as when Big Bang was compiled, before any package was
+        packages = os.path.join(os.path.normpath(self.docs_root / "packages"), "")
+        index = {p for p in tree_index(self.docs_root) if not p.startswith(packages)}
+        index |= {os.path.normpath(doc.path) for doc in docs}
+        Pipeline(bb_transforms(self.bb, self.tag, self.docs_root, index)).run(docs)
+        self.written += [doc.path for doc in docs]
+        return len(docs) + (bb_packages_source in rels)
+
+    def rebuild_pkg(self, pkg, rels):
+        config = self.configs[pkg]
+        src_root = Path(config["source"])
+        dst_root = self.docs_root / "packages" / pkg
+        markdown = self.stage(
+            src_root, dst_root, [r for r in rels if included(r, config["include"])]
+        )
+        docs = [Document.load(src, dst) for src, dst in markdown]
+        values_table = None
+        if "README.md" in rels:
+            values_table, values_doc = pkg_values(pkg, src_root, dst_root)
+            docs.append(values_doc)
+        index = tree_index(dst_root) | {os.path.normpath(doc.path) for doc in docs}
+        Pipeline(
+            pkg_transforms(
+                pkg, self.pkgs, self.repos[pkg], dst_root, index, values_table
+            )
+        ).run(docs)
+        self.written += [doc.path for doc in docs]
+        return len(docs)
+
+    def repackage(self):
+        """
+        Compile the packages whose entry in Big Bang's `chart/values.yaml` changed, drop the ones that are gone
+        """
+        pkgs = self.bb.get_pkgs()
+        configs = package_configs(self.meta, pkgs)
+        changed = {p: pkgs[p] for p in pkgs if self.pkgs.get(p) != pkgs[p]}
+        repos, _ = acquire_repos(
+            changed, configs, self.fetch_jobs, self.sparse, self.offline, self.repos
+        )
+        self.repos.update(repos)
+        for pkg in self.pkgs:
+            if pkg not in pkgs:
+                shutil.rmtree(self.docs_root / "packages" / pkg, ignore_errors=True)
+        pages = 0
+        for pkg, repo in repos.items():
+            dst_root = self.docs_root / "packages" / pkg
+            shutil.rmtree(dst_root, ignore_errors=True)
+            compile_pkg(pkg, pkgs, configs[pkg], repo, self.docs_root, self.use_cache)
+            self.written += sorted(dst_root.rglob("*.md"))
+            pages += count_pages(dst_root)
+        self.pkgs, self.configs = pkgs, configs
+        self.seen = snapshot(self.sources())
+        return pages
+
+    def recompile(self):
+        preflight(self.bb, self.docs_root)
+        compile(
+            self.bb,
+            self.tag,
+            self.jobs,
+            self.use_cache,
+            self.sparse,
+            self.fetch_jobs,
+            self.offline,
+            self.docs_root,
+            self.repos,
+        )
+        self.load()
+        return count_pages(self.docs_root)
@@ -2,4 +2,9 @@
 
 set -eu
 
-prettier --write --prose-wrap=preserve --loglevel=warn docs 
+# format the given files, or the whole `docs` folder
+if [ $# -eq 0 ]; then
+    set -- docs
+fi
+
+prettier --write --prose-wrap=preserve --loglevel=warn "$@"
@@ -10,4 +10,5 @@ poetry config virtualenvs.in-project true
 
 poetry install --no-dev
 
-poetry run bb-docs-compiler
+# a commit of Big Bang with fully up-to-date nav elements
+poetry run bb-docs-compiler --branch f2b5f0ec3792bdd29846a100962ab73b2803cefb